@@ -0,0 +1,52 @@
+"""Compare the memory used by cached mf2 parsed documents as dicts and
+after :func:`mf2util.compact_document`.
+
+    python benchmarks/compact_document.py [num_documents]
+"""
+from __future__ import print_function
+import gc
+import glob
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import mf2util  # noqa
+
+
+def load_corpus():
+    """The raw JSON of the test documents, as a fetch stage would have
+    it before parsing"""
+    pattern = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                           'interpret', '*.json')
+    return [open(path).read() for path in sorted(glob.glob(pattern))]
+
+
+def measure(corpus, num_documents, convert):
+    gc.collect()
+    tracemalloc.start()
+    cache = [convert(json.loads(corpus[ii % len(corpus)]))
+             for ii in range(num_documents)]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, cache
+
+
+def main():
+    num_documents = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    corpus = load_corpus()
+
+    dict_size, cache = measure(corpus, num_documents, lambda doc: doc)
+    del cache
+    compact_size, cache = measure(corpus, num_documents,
+                                  mf2util.compact_document)
+    print('dicts:   %d bytes per document' % (dict_size / num_documents))
+    print('compact: %d bytes per document (%.0f%% less)' % (
+        compact_size / num_documents,
+        100.0 * (dict_size - compact_size) / dict_size))
+
+
+if __name__ == '__main__':
+    main()
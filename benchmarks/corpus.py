@@ -0,0 +1,206 @@
+"""A seeded generator of synthetic mf2 documents for the benchmarks. The
+same seed always gives the same corpus, so timings from different runs
+(and different versions of mf2util) measure the same work.
+
+    python benchmarks/corpus.py [seed]
+
+prints a summary of the corpus.
+"""
+from __future__ import print_function
+import random
+import sys
+
+SITES = ['http://site%d.example.com' % ii for ii in range(50)]
+
+WORDS = ('indieweb', 'webmention', 'microformats', 'post', 'reply', 'like',
+         'feed', 'photo', 'event', 'note', 'article', 'the', 'a', 'and',
+         'of', 'with', 'to', 'from', 'homebrew', 'website', 'club')
+
+
+class Corpus(object):
+    """Generates mf2 parsed documents (and HTML and datetime strings)
+    from a random.Random seeded with `seed`."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def url(self, site=None):
+        return '%s/%d/%d' % (site or self.rng.choice(SITES),
+                             self.rng.randint(2010, 2020),
+                             self.rng.randint(1, 100000))
+
+    def datetime(self):
+        """A datetime string in one of the many forms found in the wild"""
+        rng = self.rng
+        year, month, day = (rng.randint(2010, 2020), rng.randint(1, 12),
+                            rng.randint(1, 28))
+        hour, minute, second = (rng.randint(0, 23), rng.randint(0, 59),
+                                rng.randint(0, 59))
+        forms = [
+            '%04d-%02d-%02d' % (year, month, day),
+            '%04d-%02d-%02dT%02d:%02d' % (year, month, day, hour, minute),
+            '%04d-%02d-%02dT%02d:%02d:%02dZ' % (
+                year, month, day, hour, minute, second),
+            '%04d-%02d-%02d %02d:%02d:%02d-0700' % (
+                year, month, day, hour, minute, second),
+            '%04d-%02d-%02dT%02d:%02d:%02d+05:30' % (
+                year, month, day, hour, minute, second),
+            '  %04d-%02d-%02dT%02d:%02d:%02d.123-08:00\n' % (
+                year, month, day, hour, minute, second),
+            '%04d-%02d-%02d %02d:%02d' % (year, month, day, hour, minute),
+        ]
+        return rng.choice(forms)
+
+    def bad_datetime(self):
+        return self.rng.choice(['yesterday', '2015-13', 'March 3rd, 2015',
+                                '', '15/03/2015 12:00'])
+
+    def html(self, size):
+        """Roughly `size` characters of HTML with relative and absolute
+        links, images, and some tags that are not links"""
+        rng = self.rng
+        parts = []
+        length = 0
+        while length < size:
+            choice = rng.random()
+            if choice < 0.3:
+                part = '<a href="%s">%s</a> ' % (
+                    rng.choice(['/tags/%d' % rng.randint(1, 99),
+                                '../%d.html' % rng.randint(1, 99),
+                                self.url()]), self.words(2))
+            elif choice < 0.4:
+                part = '<img src="/img/%d.jpg" alt="%s"/> ' % (
+                    rng.randint(1, 9999), self.words(3))
+            elif choice < 0.5:
+                part = '<abbr title="%s">%s</abbr> ' % (
+                    self.words(2), self.words(1))
+            else:
+                part = '<p>%s</p>' % self.words(rng.randint(5, 30))
+            parts.append(part)
+            length += len(part)
+        return ''.join(parts)
+
+    def hcard(self, site=None, uid=False):
+        site = site or self.rng.choice(SITES)
+        props = {
+            'name': [self.words(2).title()],
+            'url': [site + '/'],
+            'photo': [site + '/photo.jpg'],
+        }
+        if uid:
+            props['uid'] = [site + '/']
+        return {'type': ['h-card'], 'properties': props,
+                'value': props['name'][0]}
+
+    def cite(self, depth=0):
+        """A reply context, which replies to `depth` more contexts"""
+        props = {
+            'url': [self.url()],
+            'author': [self.hcard()],
+            'published': [self.datetime()],
+            'content': [{'html': self.words(20), 'value': self.words(20)}],
+        }
+        if depth:
+            props['in-reply-to'] = [self.cite(depth - 1)]
+        return {'type': ['h-cite'], 'properties': props}
+
+    def entry(self, site, content_size=500, reply_depth=0):
+        rng = self.rng
+        html = self.html(content_size)
+        props = {
+            'url': [self.url(site)],
+            'published': [self.datetime()],
+            'content': [{'html': html, 'value': html}],
+            'syndication': ['https://twitter.com/x/status/%d'
+                            % rng.randint(1, 10 ** 9)],
+        }
+        if rng.random() < 0.5:
+            props['name'] = [self.words(rng.randint(2, 10))]
+        if rng.random() < 0.2:
+            props['updated'] = [self.bad_datetime() if rng.random() < 0.3
+                                else self.datetime()]
+        if reply_depth:
+            props['in-reply-to'] = [self.cite(reply_depth - 1)]
+        elif rng.random() < 0.2:
+            props[rng.choice(['like-of', 'repost-of'])] = [self.url()]
+        if rng.random() < 0.3:
+            props['author'] = [self.hcard(site)]
+        return {'type': ['h-entry'], 'properties': props}
+
+    def feed(self, num_entries, content_size=500, reply_depth=0):
+        """A permalink-less h-feed, with the feed's author as a fallback"""
+        site = self.rng.choice(SITES)
+        return {
+            'items': [{
+                'type': ['h-feed'],
+                'properties': {'name': [self.words(3)],
+                               'author': [self.hcard(site)]},
+                'children': [self.entry(site, content_size, reply_depth)
+                             for _ in range(num_entries)],
+            }],
+            'rels': {'author': [site + '/'], 'me': [site + '/']},
+        }
+
+    def permalink(self, reply_depth=0, content_size=2000):
+        """A single h-entry page"""
+        site = self.rng.choice(SITES)
+        return {
+            'items': [self.entry(site, content_size, reply_depth)],
+            'rels': {'author': [site + '/']},
+        }
+
+    def event(self):
+        site = self.rng.choice(SITES)
+        html = self.html(1000)
+        return {
+            'items': [{
+                'type': ['h-event'],
+                'properties': {
+                    'name': [self.words(4)],
+                    'url': [self.url(site)],
+                    'start': [self.datetime()],
+                    'end': [self.datetime()],
+                    'location': [self.hcard()],
+                    'content': [{'html': html, 'value': html}],
+                },
+            }],
+            'rels': {},
+        }
+
+    def hcard_page(self, num_hcards, site=None):
+        """A page with many h-cards, one of which is representative"""
+        site = site or self.rng.choice(SITES)
+        items = [self.hcard() for _ in range(num_hcards)]
+        items.insert(self.rng.randint(0, num_hcards),
+                     self.hcard(site, uid=True))
+        return {'items': items, 'rels': {'me': [site + '/']}}
+
+    def comment(self, target, reply_depth=0):
+        """A webmention source that replies to, likes, or RSVPs to
+        `target`"""
+        doc = self.permalink(reply_depth, content_size=300)
+        props = doc['items'][0]['properties']
+        kind = self.rng.choice(['in-reply-to', 'like-of', 'repost-of',
+                                'rsvp'])
+        if kind == 'rsvp':
+            props['rsvp'] = [self.rng.choice(['yes', 'no', 'maybe'])]
+            kind = 'in-reply-to'
+        props.setdefault(kind, []).append(target)
+        return doc
+
+
+def main():
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    corpus = Corpus(seed)
+    feed = corpus.feed(100)
+    print('feed: %d entries' % len(feed['items'][0]['children']))
+    print('datetimes: %s' % ', '.join(
+        repr(corpus.datetime()) for _ in range(5)))
+    print('html: %r...' % corpus.html(200)[:200])
+
+
+if __name__ == '__main__':
+    main()
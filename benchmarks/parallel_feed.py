@@ -0,0 +1,65 @@
+"""Measure how :func:`mf2util.interpret_feed` scales with the number of
+worker processes.
+
+    python benchmarks/parallel_feed.py [num_entries]
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import mf2util  # noqa
+
+
+def make_feed(num_entries):
+    children = []
+    for ii in range(num_entries):
+        html = ''.join(
+            '<p>Paragraph %d with <a href="/posts/%d">a link</a> and '
+            '<img src="../img/%d.jpg"/></p>' % (jj, jj, jj)
+            for jj in range(20))
+        children.append({
+            'type': ['h-entry'],
+            'properties': {
+                'name': ['Post number %d' % ii],
+                'url': ['/posts/%d' % ii],
+                'published': ['2015-03-%02dT12:%02d:00-07:00'
+                              % (ii % 28 + 1, ii % 60)],
+                'content': [{'html': html, 'value': html}],
+            },
+        })
+    return {
+        'items': [{
+            'type': ['h-feed'],
+            'properties': {
+                'author': [{
+                    'type': ['h-card'],
+                    'properties': {'name': ['Author'],
+                                   'url': ['http://example.com/']},
+                }],
+            },
+            'children': children,
+        }],
+        'rels': {},
+    }
+
+
+def main():
+    num_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    parsed = make_feed(num_entries)
+    serial = None
+    for workers in (1, 2, 4, 8):
+        start = time.time()
+        result = mf2util.interpret_feed(
+            parsed, 'http://example.com/', max_workers=workers)
+        elapsed = time.time() - start
+        if serial is None:
+            serial, serial_time = result, elapsed
+        assert result == serial, 'results differ with %d workers' % workers
+        print('%d workers: %.2fs (%.2fx)'
+              % (workers, elapsed, serial_time / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compare the memory used by interpreted entries as dicts and as records
+(``want_records=True``).
+
+    python benchmarks/record_memory.py [num_entries]
+"""
+from __future__ import print_function
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import mf2util  # noqa
+from parallel_feed import make_feed  # noqa
+
+
+def add_replies(parsed):
+    """Give every other entry a reply context and a syndication link,
+    like a typical timeline"""
+    for ii, child in enumerate(parsed['items'][0]['children']):
+        if ii % 2:
+            child['properties']['in-reply-to'] = [{
+                'type': ['h-cite'],
+                'properties': {
+                    'url': ['http://other.example.com/%d' % ii],
+                    'name': ['Reply context %d' % ii],
+                },
+            }]
+            child['properties']['syndication'] = [
+                'https://twitter.com/example/status/%d' % ii]
+    return parsed
+
+
+def measure(parsed, want_records):
+    gc.collect()
+    tracemalloc.start()
+    result = mf2util.interpret_feed(
+        parsed, 'http://example.com/', want_records=want_records)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def main():
+    num_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    parsed = add_replies(make_feed(num_entries))
+    # drop the content, so the numbers show the overhead of the containers
+    # rather than the size of the strings
+    for child in parsed['items'][0]['children']:
+        del child['properties']['content']
+
+    dict_size, dicts = measure(parsed, want_records=False)
+    del dicts
+    record_size, records = measure(parsed, want_records=True)
+    print('dicts:   %d bytes per entry' % (dict_size / num_entries))
+    print('records: %d bytes per entry (%.0f%% less)' % (
+        record_size / num_entries, 100.0 * (dict_size - record_size) / dict_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,521 @@
+"""Time mf2util's public functions on a synthetic corpus (see corpus.py),
+and compare the timings with a saved baseline.
+
+    python benchmarks/run.py [-k NAME] [--memory | --scaling]
+                             [--save FILE] [--compare FILE]
+                             [--threshold 0.2] [--seed 0]
+
+Save a baseline before a change and compare with it afterwards; the run
+exits with status 1 if any benchmark is slower than the baseline by more
+than the threshold (a fraction, 0.2 = 20%). Baselines only make sense on
+the machine they were recorded on.
+
+With --memory, a separate set of benchmarks (large feeds, multi-MB HTML
+content, deeply nested reply contexts) is run once each under
+tracemalloc, reporting the peak memory allocated during the call and the
+number of blocks its result retains. These numbers do not depend on the
+machine's speed, so they can be compared with a tight threshold.
+
+With --scaling, the functions that see raw, possibly hostile input are
+timed on families of pathological inputs at two sizes, SCALE times
+apart, and the run exits with status 1 if any of them grows much faster
+than linearly. This needs no baseline.
+"""
+from __future__ import print_function
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+import mf2util  # noqa
+from corpus import Corpus  # noqa
+
+timer = getattr(time, 'perf_counter', time.time)
+
+BENCHMARKS = []
+
+
+def benchmark(setup):
+    """Register a benchmark. `setup` takes a Corpus and returns the
+    function to time, which takes no arguments."""
+    BENCHMARKS.append((setup.__name__, setup))
+    return setup
+
+
+@benchmark
+def interpret_feed(corpus):
+    parsed = corpus.feed(200)
+    return lambda: mf2util.interpret_feed(parsed, 'http://example.com/')
+
+
+@benchmark
+def interpret_feed_json(corpus):
+    parsed = corpus.feed(200)
+    return lambda: mf2util.interpret_feed(parsed, 'http://example.com/',
+                                          want_json=True)
+
+
+@benchmark
+def interpret_feed_incremental(corpus):
+    parsed = corpus.feed(200)
+    state = mf2util.interpret_feed_incremental(
+        parsed, 'http://example.com/')['state']
+    return lambda: mf2util.interpret_feed_incremental(
+        parsed, 'http://example.com/', state)
+
+
+@benchmark
+def dump_feed(corpus):
+    parsed = corpus.feed(200)
+    return lambda: mf2util.dump_feed(parsed, 'http://example.com/',
+                                     io.StringIO())
+
+
+@benchmark
+def interpret_deep_replies(corpus):
+    parsed = corpus.permalink(reply_depth=30)
+    return lambda: mf2util.interpret(parsed, 'http://example.com/')
+
+
+@benchmark
+def interpret_entry(corpus):
+    parsed = corpus.permalink(reply_depth=2)
+    return lambda: mf2util.interpret_entry(parsed, 'http://example.com/')
+
+
+@benchmark
+def interpret_event(corpus):
+    parsed = corpus.event()
+    return lambda: mf2util.interpret_event(parsed, 'http://example.com/')
+
+
+@benchmark
+def interpret_comment(corpus):
+    target = 'http://mysite.example.com/post/1'
+    docs = [corpus.comment(target, reply_depth=1) for _ in range(50)]
+    return lambda: [mf2util.interpret_comment(doc, 'http://example.com/',
+                                              [target]) for doc in docs]
+
+
+@benchmark
+def classify_comment(corpus):
+    target = 'http://mysite.example.com/post/1'
+    docs = [corpus.comment(target) for _ in range(200)]
+    matcher = mf2util.TargetMatcher([target])
+    return lambda: [mf2util.classify_comment(doc, matcher) for doc in docs]
+
+
+@benchmark
+def classify_mentions(corpus):
+    index = mf2util.TargetIndex()
+    for ii in range(5000):
+        index.add('http://mysite.example.com/post/%d' % ii)
+    docs = [corpus.comment('http://mysite.example.com/post/%d' % ii)
+            for ii in range(200)]
+    return lambda: [mf2util.classify_mentions(doc, index) for doc in docs]
+
+
+@benchmark
+def find_target_links(corpus):
+    html = corpus.html(200000)
+    targets = ['http://mysite.example.com/post/%d' % ii for ii in range(100)]
+    return lambda: mf2util.find_target_links(html, targets,
+                                             'http://example.com/')
+
+
+@benchmark
+def find_author(corpus):
+    site = 'http://author.example.com'
+    page = corpus.hcard_page(100, site)
+    docs = [corpus.permalink() for _ in range(50)]
+    for doc in docs:
+        doc['items'][0]['properties'].pop('author', None)
+        doc['rels']['author'] = [site + '/']
+    return lambda: [mf2util.find_author(doc, 'http://example.com/',
+                                        fetch_mf2_func=lambda url: page)
+                    for doc in docs]
+
+
+@benchmark
+def representative_hcard(corpus):
+    site = 'http://author.example.com'
+    parsed = corpus.hcard_page(500, site)
+    return lambda: mf2util.representative_hcard(parsed, site + '/')
+
+
+@benchmark
+def find_all_entries(corpus):
+    parsed = corpus.feed(500, content_size=50, reply_depth=3)
+    return lambda: mf2util.find_all_entries(
+        parsed, ['h-card'], include_properties=True)
+
+
+@benchmark
+def convert_relative_paths(corpus):
+    html = corpus.html(200000)
+    return lambda: mf2util.convert_relative_paths_to_absolute(
+        'http://example.com/a/b/', '../base/', html)
+
+
+@benchmark
+def parse_datetime(corpus):
+    strings = [corpus.datetime() for _ in range(1000)]
+    strings += [corpus.bad_datetime() for _ in range(100)]
+
+    def parse_all():
+        for s in strings:
+            try:
+                mf2util.parse_datetime(s)
+            except ValueError:
+                pass
+    return parse_all
+
+
+@benchmark
+def is_name_a_title(corpus):
+    pairs = []
+    for _ in range(500):
+        content = corpus.words(corpus.rng.randint(5, 200))
+        pairs.append((content[:corpus.rng.randint(5, 60)], content))
+    return lambda: [mf2util.is_name_a_title(name, content)
+                    for name, content in pairs]
+
+
+@benchmark
+def post_type_discovery(corpus):
+    entries = (corpus.feed(500, content_size=50)['items'][0]['children'] +
+               corpus.hcard_page(100)['items'])
+    return lambda: [mf2util.post_type_discovery(entry) for entry in entries]
+
+
+@benchmark
+def merge_timelines(corpus):
+    feeds = [mf2util.interpret_feed(corpus.feed(50, content_size=50),
+                                    'http://example.com/')['entries']
+             for _ in range(40)]
+    for entries in feeds:
+        entries.sort(key=lambda e: mf2util._sortable_datetime(
+            e.get('published')), reverse=True)
+    return lambda: list(mf2util.merge_timelines(feeds))
+
+
+@benchmark
+def compact_document(corpus):
+    parsed = corpus.feed(200)
+    return lambda: mf2util.compact_document(parsed)
+
+
+@benchmark
+def thread_index(corpus):
+    entries = mf2util.interpret_feed(
+        corpus.feed(300, content_size=50, reply_depth=3),
+        'http://example.com/')['entries']
+
+    def build():
+        index = mf2util.ThreadIndex()
+        for entry in entries:
+            index.add(entry)
+        return index
+    return build
+
+
+@benchmark
+def response_aggregator(corpus):
+    target = 'http://mysite.example.com/post/1'
+    comments = [
+        (doc['items'][0]['properties']['url'][0],
+         mf2util.interpret_comment(doc, 'http://example.com/', [target]))
+        for doc in (corpus.comment(target) for _ in range(500))]
+
+    def aggregate():
+        aggregator = mf2util.ResponseAggregator()
+        for source_url, comment in comments:
+            aggregator.add(target, source_url, comment)
+        return aggregator
+    return aggregate
+
+
+MEMORY_BENCHMARKS = []
+
+
+def memory_benchmark(setup):
+    """Register a benchmark for --memory mode. The function that `setup`
+    returns is called once, and should return its result so that the
+    memory the result retains is counted."""
+    MEMORY_BENCHMARKS.append((setup.__name__, setup))
+    return setup
+
+
+def _interpret_feed_of(num_entries):
+    def setup(corpus):
+        parsed = corpus.feed(num_entries, content_size=200)
+        return lambda: mf2util.interpret_feed(parsed, 'http://example.com/')
+    setup.__name__ = 'interpret_feed_%dk' % (num_entries // 1000)
+    return setup
+
+
+for _num_entries in (1000, 10000, 50000):
+    memory_benchmark(_interpret_feed_of(_num_entries))
+
+
+@memory_benchmark
+def convert_relative_paths_4mb(corpus):
+    html = corpus.html(4 * 1024 * 1024)
+    return lambda: mf2util.convert_relative_paths_to_absolute(
+        'http://example.com/a/b/', '../base/', html)
+
+
+@memory_benchmark
+def interpret_entry_nested_100(corpus):
+    parsed = corpus.permalink(reply_depth=100)
+    return lambda: mf2util.interpret_entry(parsed, 'http://example.com/')
+
+
+def _convert(html):
+    return mf2util.convert_relative_paths_to_absolute(
+        'http://example.com/', None, html)
+
+
+def _parse_datetime(s):
+    try:
+        mf2util.parse_datetime(s)
+    except ValueError:
+        pass
+
+
+def _cite_feed(n):
+    """An h-feed of n entries, each replying to a cite without an author"""
+    return {'items': [{
+        'type': ['h-feed'],
+        'properties': {},
+        'children': [{
+            'type': ['h-entry'],
+            'properties': {
+                'url': ['http://example.com/%d' % i],
+                'in-reply-to': [{
+                    'type': ['h-cite'],
+                    'properties': {'url': ['http://example.org/%d' % i]},
+                }],
+            },
+        } for i in range(n)],
+    }], 'rels': {}}
+
+
+# name: (function, function making an input of size n)
+SCALING_CASES = {
+    'unclosed tags': (_convert, lambda n: '<a ' * n),
+    'unclosed url tags': (_convert, lambda n: '<img ' * n),
+    'unclosed brackets': (_convert, lambda n: '<' * n),
+    'long tag body': (_convert, lambda n: '<a' + ' ' * n),
+    'repeated attributes': (_convert, lambda n: '<a ' + 'href = ' * n + '>'),
+    'unclosed quote': (_convert, lambda n: '<a href="x' + ' href="' * n),
+    'no closing quote': (_convert, lambda n: '<a href="' + '<img ' * n),
+    'lt in quotes': (_convert,
+                     lambda n: '<img alt="' + '<' * n + '" src="a">'),
+    'many urls': (_convert,
+                  lambda n: '<video src="a" poster="b">' * (n // 10)),
+    'link scan': (lambda html: mf2util.find_target_links(
+        html, ['http://example.com/%d' % i for i in range(1000)]),
+        lambda n: '<a href="http://example.com/1">' * (n // 10)),
+    'long year': (_parse_datetime, lambda n: '1' * n),
+    'long fraction': (_parse_datetime,
+                      lambda n: '2014-01-01T10:10:10.' + '1' * n + 'x'),
+    'long whitespace': (_parse_datetime,
+                        lambda n: '2014-01-01' + ' \t' * n + 'x'),
+    'name and content': (lambda n: mf2util.is_name_a_title(*n),
+                         lambda n: ('a' * n, 'a' * (n // 2) + 'b')),
+    'author-less cites': (lambda parsed: mf2util.interpret_feed(
+        parsed, 'http://example.com/'), lambda n: _cite_feed(n // 10)),
+}
+
+SCALING_SMALL = 5000
+SCALE = 8
+# linear growth would be SCALE, quadratic SCALE ** 2
+MAX_GROWTH = 3 * SCALE
+
+
+def check_scaling(names, repeat):
+    """Time each scaling case at two sizes, and return the names of those
+    that grow more than MAX_GROWTH times"""
+    failures = []
+    for name in sorted(SCALING_CASES):
+        if names and not any(n in name for n in names):
+            continue
+        func, make_input = SCALING_CASES[name]
+        small, large = make_input(SCALING_SMALL), make_input(
+            SCALING_SMALL * SCALE)
+        small_time = time_function(lambda: func(small), repeat, 0.01)
+        large_time = time_function(lambda: func(large), repeat, 0.01)
+        growth = large_time / small_time
+        flag = ''
+        if growth > MAX_GROWTH:
+            flag = '  NOT LINEAR'
+            failures.append(name)
+        print('%-34s %10.3f ms %10.3f ms %6.1fx%s' % (
+            name, small_time * 1000, large_time * 1000, growth, flag))
+        sys.stdout.flush()
+    return failures
+
+
+def time_function(func, repeat, min_time=0.1):
+    """The best time per call of `func`, in seconds, calling it enough
+    times in a row for each measurement to take at least `min_time`"""
+    number = 1
+    while True:
+        start = timer()
+        for _ in range(number):
+            func()
+        elapsed = timer() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = timer()
+        for _ in range(number):
+            func()
+        best = min(best, (timer() - start) / number)
+    return best
+
+
+def measure_memory(func):
+    """The peak memory allocated while calling `func` once, and the number
+    of memory blocks still allocated for its result afterwards"""
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    return peak, blocks
+
+
+def run(names, seed, repeat, memory=False):
+    results = {}
+    for name, setup in (MEMORY_BENCHMARKS if memory else BENCHMARKS):
+        if names and not any(n in name for n in names):
+            continue
+        # a fresh corpus for each benchmark, so its input does not depend
+        # on which other benchmarks ran
+        func = setup(Corpus(seed))
+        if memory:
+            peak, blocks = measure_memory(func)
+            results[name + '.peak'] = peak
+            results[name + '.blocks'] = blocks
+            print('%-34s %s %s' % (name, format_result(name + '.peak', peak),
+                                   format_result(name + '.blocks', blocks)))
+        else:
+            results[name] = time_function(func, repeat)
+            print('%-34s %s' % (name, format_result(name, results[name])))
+        sys.stdout.flush()
+    return results
+
+
+def format_result(name, value):
+    if name.endswith('.peak'):
+        return '%10.1f KiB' % (value / 1024.0)
+    if name.endswith('.blocks'):
+        return '%10d blocks' % value
+    return '%10.3f ms' % (value * 1000)
+
+
+def compare(results, baseline, threshold):
+    """Print the change from the baseline for each benchmark, and return
+    the names of those that regressed by more than `threshold`"""
+    regressions = []
+    print()
+    print('%-34s %17s %17s %8s' % ('benchmark', 'baseline', 'current',
+                                   'change'))
+    for name in sorted(results):
+        current = format_result(name, results[name])
+        if name not in baseline:
+            print('%-34s %17s %17s' % (name, '-', current))
+            continue
+        change = results[name] / float(baseline[name] or 1) - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-34s %17s %17s %+7.1f%%%s' % (
+            name, format_result(name, baseline[name]), current,
+            change * 100, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark mf2util on a synthetic corpus.')
+    parser.add_argument('-k', dest='names', action='append', default=[],
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--memory', action='store_true',
+                        help='measure peak memory and retained allocations '
+                        'with tracemalloc instead of time')
+    parser.add_argument('--scaling', action='store_true',
+                        help='check that functions given hostile input '
+                        'take linear time')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='measurements per benchmark (the best is kept)')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='increase that counts as a regression, as a '
+                        'fraction (default 0.2)')
+    args = parser.parse_args(argv)
+    mode = 'memory' if args.memory else 'time'
+    # the corpus has unparseable datetimes on purpose
+    logging.getLogger().setLevel(logging.ERROR)
+
+    if args.scaling:
+        failures = check_scaling(args.names, args.repeat)
+        if failures:
+            print('\n%d case(s) grew more than %dx for %dx the input: %s' % (
+                len(failures), MAX_GROWTH, SCALE, ', '.join(failures)))
+            return 1
+        return 0
+
+    results = run(args.names, args.seed, args.repeat, args.memory)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'seed': args.seed, 'mode': mode,
+                       'python': platform.python_version(),
+                       'results': results}, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('mode', 'time') != mode:
+            print('error: the baseline is a %s baseline'
+                  % baseline.get('mode', 'time'))
+            return 2
+        if baseline.get('seed') != args.seed:
+            print('warning: the baseline was recorded with seed %s'
+                  % baseline.get('seed'))
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print('\n%d regression(s) over %d%%: %s' % (
+                len(regressions), args.threshold * 100,
+                ', '.join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
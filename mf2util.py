@@ -7,11 +7,17 @@ certain interesting properties."""
 
 
 from __future__ import unicode_literals
-from collections import deque
+from collections import deque, OrderedDict
 from datetime import tzinfo, timedelta, datetime, date
+import hashlib
+import heapq
+import json
 import logging
+import pickle
 import re
 import string
+import threading
+import time
 
 import unicodedata
 import sys
@@ -20,15 +26,22 @@ PY3 = sys.version_info[0] >= 3
 
 # 2/3 compatibility
 if PY3:
-    from urllib.parse import urljoin
+    from collections.abc import Mapping
+    from urllib.parse import urljoin, urlparse
     from datetime import timezone
     utc = timezone.utc
     timezone_from_offset = timezone
     string_type = str
+    _intern = sys.intern
 else:
-    from urlparse import urljoin
+    from collections import Mapping
+    from urlparse import urljoin, urlparse
     string_type = unicode
 
+    def _intern(s):
+        # unicode strings cannot be interned in python 2
+        return s
+
     # timezone shims for py2
 
     class UTC(tzinfo):
@@ -94,6 +107,10 @@ LOCATION_PROPERTIES = frozenset((
     'name',
 ))
 
+# Properties of an h-entry whose values are references to other posts
+NESTED_PROPERTIES = ('in-reply-to', 'like-of', 'repost-of', 'bookmark-of',
+                     'comment', 'like', 'repost')
+
 
 def find_first_entry(parsed, types):
     """Find the first interesting h-* object in BFS-order
@@ -128,7 +145,7 @@ def _find_all_entries(parsed, types, include_properties):
         queue.extend(item.get('children', []))
         if include_properties:
             queue.extend(prop for props in item.get('properties', {}).values()
-                         for prop in props if isinstance(prop, dict))
+                         for prop in props if isinstance(prop, _DICT_TYPES))
 
 
 def find_datetimes(parsed):
@@ -156,57 +173,322 @@ def get_plain_text(values, strip=True):
     """
     if values:
         v = values[0]
-        if isinstance(v, dict):
+        if isinstance(v, _DICT_TYPES):
             v = v.get('value', '')
         if strip:
             v = v.strip()
         return v
 
 
-def classify_comment(parsed, target_urls):
+class CompactNode(Mapping):
+    """A read-only, compact stand-in for one of the dicts in a mf2 parsed
+    document, made by :func:`compact_document`. Keys and values are kept
+    in two tuples, and nodes with the same keys (e.g. every item with
+    type, properties and children) share one tuple of interned keys, so
+    a node costs little more than its values. Lists become tuples.
+    """
+    __slots__ = ('_keys', '_values')
+
+    def __init__(self, keys, values):
+        object.__setattr__(self, '_keys', keys)
+        object.__setattr__(self, '_values', values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompactNode is immutable')
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __reduce__(self):
+        return CompactNode, (self._keys, self._values)
+
+    def __repr__(self):
+        return 'CompactNode(%r)' % dict(self.items())
+
+    def to_dict(self):
+        """The node as the mf2py-style dict it was made from"""
+        return _from_compact(self)
+
+
+_DICT_TYPES = (dict, CompactNode)
+
+# tuples of keys shared between nodes, up to a limit so documents with
+# unusual keys (e.g. rel-urls) cannot grow it without bound
+_KEY_TUPLES = {}
+_MAX_KEY_TUPLES = 4096
+
+
+def compact_document(parsed):
+    """Convert a mf2 parsed document into a compact, immutable form that
+    takes much less memory than the nested dicts and lists, e.g. for
+    keeping many parsed documents in a cache. Property names and types
+    are interned, so they are shared between documents. Every function in
+    this module accepts the result in place of the parsed dict.
+
+    :param dict parsed: a mf2py parsed dict
+    :return: a :class:`CompactNode` that reads like `parsed`, with tuples
+      in place of lists
+    """
+    return _compact(parsed, False)
+
+
+def _compact(value, intern_strings):
+    if isinstance(value, dict):
+        keys = tuple(_intern(key) for key in value)
+        keys = _KEY_TUPLES.get(keys, keys)
+        if len(_KEY_TUPLES) < _MAX_KEY_TUPLES:
+            _KEY_TUPLES.setdefault(keys, keys)
+        return CompactNode(keys, tuple(
+            _compact(val, key == 'type') for key, val in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_compact(val, intern_strings) for val in value)
+    if intern_strings and isinstance(value, string_type):
+        return _intern(value)
+    return value
+
+
+def _from_compact(value):
+    if isinstance(value, CompactNode):
+        return dict((key, _from_compact(val)) for key, val in value.items())
+    if isinstance(value, tuple):
+        return [_from_compact(val) for val in value]
+    return value
+
+
+def _json_default(obj):
+    """Serialize compact document nodes like the dicts they stand for"""
+    if isinstance(obj, CompactNode):
+        return dict(obj.items())
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+def classify_comment(parsed, target_urls, hentry=None):
     """Find and categorize comments that reference any of a collection of
     target URLs. Looks for references of type reply, like, and repost.
 
     :param dict parsed: a mf2py parsed dict
     :param list target_urls: a collection of urls that represent the
-      target post. this can include alternate or shortened URLs.
+      target post. this can include alternate or shortened URLs. Pass a
+      :class:`TargetMatcher` to also match variants of them.
+    :param dict hentry: (optional) the h-entry to classify. if provided,
+      we can avoid a redundant call to find_first_entry
     :return: a list of applicable comment types ['like', 'reply', 'repost']
     """
-    def process_references(objs, reftypes, result):
-        for obj in objs:
-            if isinstance(obj, dict):
-                if any(url in target_urls for url
-                       in obj.get('properties', {}).get('url', [])):
-                    result += (r for r in reftypes if r not in result)
-            elif obj in target_urls:
-                result += (r for r in reftypes if r not in result)
+    if not hentry:
+        hentry = find_first_entry(parsed, ['h-entry'])
+        if not hentry:
+            return []
+    return _classify_comment(hentry, _target_set(target_urls))
+
+
+def _target_set(target_urls):
+    """Target URLs as a set, so each reference is a single lookup"""
+    if isinstance(target_urls, (set, frozenset, TargetMatcher)):
+        return target_urls
+    if isinstance(target_urls, string_type):
+        return frozenset([target_urls])
+    return frozenset(target_urls)
+
 
+def _classify_comment(hentry, target_urls):
     result = []
-    hentry = find_first_entry(parsed, ['h-entry'])
-    if hentry:
-        reply_type = []
-        if 'rsvp' in hentry['properties']:
-            reply_type.append('rsvp')
-        if 'invitee' in hentry['properties']:
-            reply_type.append('invite')
-        reply_type.append('reply')
-
-        # TODO handle rel=in-reply-to
-        for prop in ('in-reply-to', 'reply-to', 'reply'):
-            process_references(
-                hentry['properties'].get(prop, []), reply_type, result)
-
-        for prop in ('like-of', 'like'):
-            process_references(
-                hentry['properties'].get(prop, []), ('like',), result)
-
-        for prop in ('repost-of', 'repost'):
-            process_references(
-                hentry['properties'].get(prop, []), ('repost',), result)
+    for url, reftypes in _references(hentry):
+        if url in target_urls:
+            result += (r for r in reftypes if r not in result)
+    return result
+
+
+def _references(hentry):
+    """Yield (url, comment types) for each URL the h-entry replies to,
+    likes, or reposts"""
+    props = hentry['properties']
+    reply_type = []
+    if 'rsvp' in props:
+        reply_type.append('rsvp')
+    if 'invitee' in props:
+        reply_type.append('invite')
+    reply_type.append('reply')
+
+    # TODO handle rel=in-reply-to
+    for names, reftypes in ((('in-reply-to', 'reply-to', 'reply'), reply_type),
+                            (('like-of', 'like'), ('like',)),
+                            (('repost-of', 'repost'), ('repost',))):
+        for prop in names:
+            for obj in props.get(prop, []):
+                if isinstance(obj, _DICT_TYPES):
+                    urls = obj.get('properties', {}).get('url', [])
+                else:
+                    urls = [obj]
+                for url in urls:
+                    if isinstance(url, string_type):
+                        yield url, reftypes
+
+
+def classify_mentions(parsed, targets, hentry=None):
+    """Like :func:`classify_comment`, but for a site with many target
+    posts: find every target that the document's h-entry references.
+    Each reference is looked up once in the index, so the cost depends on
+    the number of references, not the number of targets.
+
+    :param dict parsed: a mf2py parsed dict
+    :param TargetIndex targets: all the target posts and their aliases
+    :param dict hentry: (optional) the h-entry to classify. if provided,
+      we can avoid a redundant call to find_first_entry
+    :return: a dict from each referenced target to a list of comment
+      types, as returned by :func:`classify_comment`
+    """
+    if not hentry:
+        hentry = find_first_entry(parsed, ['h-entry'])
+        if not hentry:
+            return {}
 
+    result = {}
+    for url, reftypes in _references(hentry):
+        target = targets.lookup(url)
+        if target is not None:
+            types = result.setdefault(target, [])
+            types += (r for r in reftypes if r not in types)
     return result
 
 
+def _canonical_url(url):
+    """Normalize an http(s) URL so that trivially different forms of it
+    compare equal: the scheme, the case of the host, a default port, a
+    trailing slash, and the fragment are ignored. Other URLs are
+    returned unchanged, as are malformed ones (e.g. 'http://[oops/').
+    """
+    try:
+        parsed = urlparse(url.strip())
+    except ValueError:
+        return url
+    scheme = parsed.scheme.lower()
+    if scheme not in ('http', 'https'):
+        return url
+    host = parsed.netloc.lower()
+    if host.endswith(':80') or host.endswith(':443'):
+        host = host.rsplit(':', 1)[0]
+    canonical = '//' + host + parsed.path.rstrip('/')
+    if parsed.query:
+        canonical += '?' + parsed.query
+    return canonical
+
+
+class TargetMatcher(object):
+    """A set of URLs that all identify one target post, for passing as
+    `target_urls` to :func:`classify_comment` or
+    :func:`interpret_comment`. URLs are compared in canonical form, so
+    http and https, a trailing slash, the case of the host, etc. do not
+    need to be listed separately. Build it once per target post; any
+    number of aliases (e.g. shortlinks) can be added without slowing
+    down lookups.
+
+    :param list urls: (optional) the target URL and its aliases
+    """
+
+    def __init__(self, urls=()):
+        self._urls = set()
+        for url in urls:
+            self.add(url)
+
+    def add(self, url):
+        """Add an alternate URL for the target"""
+        self._urls.add(_canonical_url(url))
+
+    def __contains__(self, url):
+        return (isinstance(url, string_type) and
+                _canonical_url(url) in self._urls)
+
+    def __len__(self):
+        return len(self._urls)
+
+
+def find_target_links(html, targets, source_url=None, base_href=None):
+    """Find links to any of a set of target URLs in a document's HTML,
+    e.g. to verify that the source of a webmention really links to its
+    target. Looks at the same tag attributes as
+    :func:`convert_relative_paths_to_absolute` (a href, img src, etc.)
+    and compares URLs in canonical form (see :class:`TargetMatcher`).
+
+    The HTML is scanned once and each link is a single lookup, so this
+    takes time linear in the length of `html` however many targets
+    there are.
+
+    :param str html: the HTML to search, e.g. the html of e-content
+    :param targets: a :class:`TargetIndex`, or a collection of target URLs
+    :param str source_url: (optional) the URL of the document, used to
+      resolve relative links
+    :param str base_href: (optional) the href value of the base tag
+    :return: a dict from each target found to a list of the offsets in
+      `html` where links to it start
+    """
+    if not isinstance(targets, TargetIndex):
+        index = TargetIndex()
+        for target in targets:
+            index.add(target)
+        targets = index
+
+    base_url = source_url
+    if source_url and base_href:
+        base_url = urljoin(source_url, base_href)
+
+    result = {}
+    for start, end in _url_attribute_values(html):
+        url = html[start:end].strip()
+        if base_url:
+            try:
+                url = urljoin(base_url, url)
+            except ValueError:
+                pass  # malformed, e.g. 'http://[oops/'; compare it as is
+        target = targets.lookup(url)
+        if target is not None:
+            result.setdefault(target, []).append(start)
+    return result
+
+
+class TargetIndex(object):
+    """An inverted index from the canonical form of every URL (and alias)
+    of many target posts to the target it identifies, for
+    :func:`classify_mentions`. If two targets share an alias, the one
+    added last wins.
+    """
+
+    def __init__(self):
+        self._targets = {}
+
+    def add(self, target, aliases=()):
+        """Add a target post, identified by its URL, and any alternate
+        URLs for it"""
+        self._targets[_canonical_url(target)] = target
+        for alias in aliases:
+            self._targets[_canonical_url(alias)] = target
+
+    def lookup(self, url):
+        """The target that `url` identifies, or None"""
+        if isinstance(url, string_type):
+            return self._targets.get(_canonical_url(url))
+
+    def __len__(self):
+        return len(self._targets)
+
+
 def parse_author(obj):
     """Parse the value of a u-author property, can either be a compound
     h-card or a single name or url.
@@ -215,16 +497,18 @@ def parse_author(obj):
     :result: a dict containing the author's name, photo, and url
     """
     result = {}
-    if isinstance(obj, dict):
+    if isinstance(obj, _DICT_TYPES):
         names = obj['properties'].get('name')
         photos = obj['properties'].get('photo')
         urls = obj['properties'].get('url')
+        # values may be nested dicts, e.g. a photo with alt text, which
+        # must be plain dicts in the result if `obj` is a CompactNode
         if names:
-            result['name'] = names[0]
+            result['name'] = _from_compact(names[0])
         if photos:
-            result['photo'] = photos[0]
+            result['photo'] = _from_compact(photos[0])
         if urls:
-            result['url'] = urls[0]
+            result['url'] = _from_compact(urls[0])
     elif obj:
         if obj.startswith('http://') or obj.startswith('https://'):
             result['url'] = obj
@@ -246,21 +530,25 @@ def find_author(parsed, source_url=None, hentry=None, fetch_mf2_func=None):
         and returns parsed mf2
     :return: a dict containing the author's name, photo, and url
     """
+    if not hentry:
+        hentry = find_first_entry(parsed, ['h-entry'])
+        if not hentry:
+            return None
+
+    return _find_author(
+        _InterpretContext(parsed, source_url, fetch_mf2_func=fetch_mf2_func),
+        hentry)
+
+
+def _find_author(ctx, hentry):
     def find_hentry_author(hentry):
         for obj in hentry['properties'].get('author', []):
             return parse_author(obj)
 
     def find_parent_hfeed_author(hentry):
-        for hfeed in _find_all_entries(parsed, ['h-feed'], False):
-            # find the h-entry's parent h-feed
-            if hentry in hfeed.get('children', []):
-                for obj in hfeed['properties'].get('author', []):
-                    return parse_author(obj)
-
-    if not hentry:
-        hentry = find_first_entry(parsed, ['h-entry'])
-        if not hentry:
-            return None
+        for hfeed in ctx.parent_hfeeds(hentry):
+            for obj in hfeed['properties'].get('author', []):
+                return parse_author(obj)
 
     author_page = None
 
@@ -288,17 +576,24 @@ def find_author(parsed, source_url=None, hentry=None, fetch_mf2_func=None):
     if not author_page:
         # 6.1 if the page has a rel-author link, let the author-page's
         #     URL be the href of the rel-author link
-        rel_authors = parsed.get('rels', {}).get('author', [])
-        if rel_authors:
-            author_page = rel_authors[0]
+        if ctx.rel_authors:
+            author_page = ctx.rel_authors[0]
 
     # 7. if there is an author-page URL
     if author_page:
-        if not fetch_mf2_func:
+        if not ctx.fetch_mf2_func:
             return {'url': author_page}
 
         # 7.1 get the author-page from that URL and parse it for microformats2
-        parsed = fetch_mf2_func(author_page)
+        metrics.add('fetches')
+        try:
+            parsed = ctx.call('fetch', hentry, ctx.fetch_mf2_func,
+                              author_page)
+        except Exception:
+            metrics.add('fetch_failures')
+            raise
+        if not parsed:
+            return None
         hcards = find_all_entries(parsed, ['h-card'])
 
         # 7.2 if author-page has 1+ h-card with url == uid ==
@@ -314,7 +609,7 @@ def find_author(parsed, source_url=None, hentry=None, fetch_mf2_func=None):
         #     which matches the href of a rel-me link on the author-page
         #     (perhaps the same hyperlink element as the u-url, though not
         #     required to be), use first such h-card, exit.
-        rel_mes = parsed.get('rels', {}).get('me', [])
+        rel_mes = frozenset(parsed.get('rels', {}).get('me', []))
         for hcard in hcards:
             hcard_url = get_plain_text(hcard['properties'].get('url'))
             if hcard_url and hcard_url in rel_mes:
@@ -341,6 +636,7 @@ def representative_hcard(parsed, source_url):
     :return: the representative h-card if one is found
     """
     hcards = find_all_entries(parsed, ['h-card'], include_properties=True)
+    rel_mes = frozenset(parsed.get('rels', {}).get('me', []))
     # uid and url both match source_url
     for hcard in hcards:
         if (source_url in hcard['properties'].get('uid', [])
@@ -348,8 +644,7 @@ def representative_hcard(parsed, source_url):
             return hcard
     # url that is also a rel=me
     for hcard in hcards:
-        if any(url in parsed.get('rels', {}).get('me', [])
-               for url in hcard['properties'].get('url', [])):
+        if any(url in rel_mes for url in hcard['properties'].get('url', [])):
             return hcard
     # single hcard with matching url
     found = None
@@ -368,28 +663,96 @@ def convert_relative_paths_to_absolute(source_url, base_href, html):
     displaying images or links in reply contexts and comments.
 
     Gets list of tags/attributes from `URL_ATTRIBUTES`. Note that this
-    function uses a regular expression to avoid adding a library
-    dependency on a proper parser.
+    function uses a simple scanner to avoid adding a library dependency
+    on a proper parser. It runs in time linear in the length of `html`,
+    even for malformed or hostile input.
 
     :param str source_url: the source of the parsed document.
     :param str html: the text of the source document
     :return: the document with relative urls replaced with absolute ones
     """
-    def do_convert(match):
-        base_url = urljoin(source_url, base_href) if base_href else source_url
-        return (match.string[match.start(0):match.start(1)] +
-                urljoin(base_url, match.group(1)) +
-                match.string[match.end(1):match.end(0)])
-
-    if source_url:
-        for tagname, attributes in URL_ATTRIBUTES.items():
-            for attribute in attributes:
-                pattern = re.compile(
-                    '<%s[^>]*?%s\s*=\s*[\'"](.*?)[\'"]' % (tagname, attribute),
-                    flags=re.DOTALL | re.MULTILINE | re.IGNORECASE)
-                html = pattern.sub(do_convert, html)
-
-    return html
+    if source_url and base_href:
+        source_url = urljoin(source_url, base_href)
+    return _convert_relative_paths(source_url, html)
+
+
+# A start tag: its name, then everything up to the next >
+_TAG_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)[^>]*')
+_QUOTE_RE = re.compile(r'[\'"]')
+_URL_ATTRIBUTE_RES = dict(
+    (tagname, [re.compile(r'%s\s*=\s*[\'"]' % attribute, re.IGNORECASE)
+               for attribute in attributes])
+    for tagname, attributes in URL_ATTRIBUTES.items())
+
+
+def _convert_relative_paths(base_url, html):
+    if not base_url:
+        return html
+
+    parts = []
+    copied = 0  # html[:copied] has been appended to parts
+    joined = {}
+    for start, end in _url_attribute_values(html):
+        value = html[start:end]
+        if value not in joined:
+            try:
+                joined[value] = urljoin(base_url, value)
+            except ValueError:
+                joined[value] = value  # malformed, leave it alone
+        parts.append(html[copied:start])
+        parts.append(joined[value])
+        copied = end
+
+    if not parts:
+        return html
+    parts.append(html[copied:])
+    return ''.join(parts)
+
+
+def _url_attribute_values(html):
+    """Yield the (start, end) span of the value of each URL attribute
+    (see `URL_ATTRIBUTES`) in `html`, in order.
+
+    Single left-to-right pass: tag bodies never overlap and every search
+    for a closing quote picks up where the previous one stopped, so this
+    takes time linear in the length of `html`, whatever its contents.
+    """
+    pos = 0
+    last_end = 0
+    # no quote in html[quote_from:quote_at], html[quote_at] is a quote
+    # (or quote_at is len(html) if there is none)
+    quote_from = quote_at = -1
+
+    while True:
+        tag = _TAG_RE.search(html, pos)
+        if not tag:
+            break
+        pos = tag.end()
+        attribute_res = _URL_ATTRIBUTE_RES.get(tag.group(1).lower())
+        if not attribute_res:
+            continue
+
+        matches = [attribute_re.search(html, tag.end(1), tag.end())
+                   for attribute_re in attribute_res]
+        for match in sorted((m for m in matches if m), key=lambda m: m.end()):
+            start = match.end()
+            if start < last_end:
+                continue  # inside the value of the previous attribute
+            if not quote_from <= start <= quote_at:
+                quote = _QUOTE_RE.search(html, start)
+                quote_from = start
+                quote_at = quote.start() if quote else len(html)
+            if quote_at == len(html):
+                return  # no closing quote in the rest of the document
+
+            last_end = quote_at
+            # a quoted value may contain < or >; resume after it
+            pos = max(pos, quote_at + 1)
+            yield start, quote_at
+
+
+_NOT_A_WORD_RE = re.compile(
+    '[' + re.escape(string.whitespace + string.punctuation) + ']')
 
 
 def is_name_a_title(name, content):
@@ -418,7 +781,7 @@ def is_name_a_title(name, content):
             s = s.decode('utf-8')
         s = unicodedata.normalize('NFKD', s)
         s = s.lower()
-        s = re.sub('[' + string.whitespace + string.punctuation + ']', '', s)
+        s = _NOT_A_WORD_RE.sub('', s)
         return s
     if not content:
         return True
@@ -470,6 +833,16 @@ def post_type_discovery(hentry):
     return 'note'
 
 
+# Anchored at both ends, and each repeat is bounded or followed by a
+# different character class, so matching is linear in the input length.
+_WHITESPACE_RE = re.compile(r'\s+')
+_DATETIME_RE = re.compile(
+    r'(?P<year>\d{4,})-(?P<month>\d{1,2})-(?P<day>\d{1,2})'
+    r'((T| )(?P<hour>\d{1,2}):(?P<minute>\d{2})'
+    r'(:(?P<second>\d{2})(\.(?P<microsecond>\d+))?)? ?'
+    r'((?P<tzz>Z)|(?P<tzsign>[+-])(?P<tzhour>\d{1,2}):?(?P<tzminute>\d{2}))?)?$')
+
+
 def parse_datetime(s):
     """The definition for microformats2 dt-* properties are fairly
     lenient.  This method converts an mf2 date string into either a
@@ -484,13 +857,8 @@ def parse_datetime(s):
     if not s:
         return None
 
-    s = re.sub('\s+', ' ', s)
-    date_re = "(?P<year>\d{4,})-(?P<month>\d{1,2})-(?P<day>\d{1,2})"
-    time_re = "(?P<hour>\d{1,2}):(?P<minute>\d{2})(:(?P<second>\d{2})(\.(?P<microsecond>\d+))?)?"
-    tz_re = "(?P<tzz>Z)|(?P<tzsign>[+-])(?P<tzhour>\d{1,2}):?(?P<tzminute>\d{2})"
-    dt_re = "%s((T| )%s ?(%s)?)?$" % (date_re, time_re, tz_re)
-
-    m = re.match(dt_re, s)
+    s = _WHITESPACE_RE.sub(' ', s)
+    m = _DATETIME_RE.match(s)
     if not m:
         raise ValueError('unrecognized datetime %s' % s)
 
@@ -530,11 +898,587 @@ def parse_datetime(s):
 parse_dt = parse_datetime  # backcompat
 
 
-def _interpret_common_properties(
-        parsed, source_url, base_href, hentry, use_rel_syndication,
-        want_json, fetch_mf2_func):
+class Limits(object):
+    """Caps on the work done interpreting a single document, for
+    documents that come from untrusted sources (e.g. webmentions).
+    Each cap is optional, None means unlimited.
+
+    When a cap is hit, interpretation carries on with less detail: nested
+    items past the cap are reduced to their url, extra values are
+    dropped, and oversized content is left as-is. The item that lost
+    detail, and the top-level result, get the property 'truncated': True.
+
+    :param int max_depth: how deeply reply contexts and comments may be
+      nested inside the top-level item
+    :param int max_children: how many values of each reply context or
+      comment property, and how many children of a feed, are interpreted
+    :param int max_content_length: content longer than this many
+      characters is not rewritten (relative paths are left alone), and
+      only this much of the name and content is compared when deciding
+      whether the name is a title
+    :param int max_items: how many items (entries, events, and nested
+      items) are interpreted in total per call
+    """
+
+    def __init__(self, max_depth=None, max_children=None,
+                 max_content_length=None, max_items=None):
+        self.max_depth = max_depth
+        self.max_children = max_children
+        self.max_content_length = max_content_length
+        self.max_items = max_items
+
+    def __repr__(self):
+        return ('Limits(max_depth=%r, max_children=%r, '
+                'max_content_length=%r, max_items=%r)' % (
+                    self.max_depth, self.max_children,
+                    self.max_content_length, self.max_items))
+
+
+class StageTimer(object):
+    """A tracer for the interpret methods that adds up the time spent in
+    each stage, across any number of calls (and threads), to find where
+    the time goes on a production workload::
+
+        timer = mf2util.StageTimer()
+        for parsed, url in documents:
+            mf2util.interpret(parsed, url, tracer=timer)
+        timer.stats()
+
+    Any object with the same `start` and `end` methods can be passed as
+    `tracer`. The stages are:
+
+    - 'find': finding the h-entry, h-event or h-feed in the document
+    - 'interpret': interpreting an item, nested ones included
+    - 'author': authorship discovery, see :func:`find_author`
+    - 'fetch': fetching an author page with `fetch_mf2_func`
+    - 'datetime': :func:`parse_datetime`
+    - 'content': :func:`convert_relative_paths_to_absolute`
+    - 'title': :func:`is_name_a_title`
+    - 'classify': classifying a comment (:func:`interpret_comment` only)
+
+    Stages are nested (e.g. 'author' runs inside 'interpret'), so each
+    stage gets both its total time and its self time, which leaves out
+    the stages nested inside it. The total time of 'interpret' counts a
+    nested reply context in its parent as well.
+
+    :param callable clock: (optional) returns the current time in seconds
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or getattr(time, 'perf_counter', time.time)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def start(self, stage, item_type, depth):
+        """Called when a stage starts.
+
+        :param str stage: the stage, e.g. 'author'
+        :param str item_type: the first type of the item being
+          interpreted, e.g. 'h-entry', or None
+        :param int depth: how deeply the item is nested, 0 for the
+          top-level item
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append([self.clock(), 0.0])
+
+    def end(self, stage, item_type, depth):
+        """Called when a stage ends, with the same arguments as `start`"""
+        stack = self._local.stack
+        started, nested = stack.pop()
+        elapsed = self.clock() - started
+        if stack:
+            stack[-1][1] += elapsed
+        with self._lock:
+            stats = self._stats.get(stage)
+            if stats is None:
+                stats = self._stats[stage] = {
+                    'count': 0, 'total': 0.0, 'self': 0.0}
+            stats['count'] += 1
+            stats['total'] += elapsed
+            stats['self'] += elapsed - nested
+
+    def stats(self):
+        """A dict from each stage to its 'count', and 'total' and 'self'
+        time in seconds"""
+        with self._lock:
+            return dict((stage, dict(stats))
+                        for stage, stats in self._stats.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+class Metrics(object):
+    """Counters of the work done by the interpret methods, for exporting
+    to a monitoring system. ``mf2util.metrics`` counts for the whole
+    process (each process of `interpret_feed` with `max_workers` counts
+    separately)::
+
+        {
+         'documents': documents interpreted,
+         'items': entries, events, reply contexts etc. interpreted,
+         'truncations': limits hit, see :class:`Limits`,
+         'fetches': author pages fetched with `fetch_mf2_func`,
+         'fetch_failures': fetches that raised an exception,
+         'datetime_failures': dates that could not be parsed,
+         'datetime_failure_patterns': the number of failures for each
+           shape of date string, with runs of digits replaced by '9' and
+           of letters by 'a' (e.g. '9/9/9 9:9')
+         'max_depth': the deepest nesting of reply contexts seen,
+         'result_cache_hits', 'result_cache_misses': calls answered from,
+           or added to, a `result_cache`,
+        }
+
+    Failed dates are also logged, at most `log_limit` times every
+    `log_interval` seconds; the next message logged after that says
+    how many were left out.
+    """
+
+    COUNTERS = ('documents', 'items', 'truncations', 'fetches',
+                'fetch_failures', 'datetime_failures', 'result_cache_hits',
+                'result_cache_misses')
+    # distinct datetime patterns counted, the rest are counted as 'other'
+    MAX_PATTERNS = 100
+
+    def __init__(self, log_limit=10, log_interval=60.0, clock=time.time):
+        self.log_limit = log_limit
+        self.log_interval = log_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._log_window = None
+        self._logged = 0
+        self._suppressed = 0
+        self._clear()
+
+    def _clear(self):
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+        self._patterns = {}
+        self._max_depth = 0
+
+    def add(self, counter, count=1):
+        with self._lock:
+            self._counters[counter] += count
+
+    def add_document(self, ctx):
+        """Count a document once it has been interpreted"""
+        with self._lock:
+            counters = self._counters
+            counters['documents'] += 1
+            counters['items'] += ctx.items
+            counters['truncations'] += ctx.truncations
+            if ctx.deepest > self._max_depth:
+                self._max_depth = ctx.deepest
+
+    def datetime_failure(self, date_str):
+        """Count, and maybe log, a date that could not be parsed"""
+        pattern = _NOT_DIGITS_RE.sub('a', _DIGITS_RE.sub('9', date_str))[:40]
+        now = self.clock()
+        with self._lock:
+            self._counters['datetime_failures'] += 1
+            if (pattern not in self._patterns and
+                    len(self._patterns) >= self.MAX_PATTERNS):
+                pattern = 'other'
+            self._patterns[pattern] = self._patterns.get(pattern, 0) + 1
+
+            suppressed = 0
+            if (self._log_window is None or
+                    now - self._log_window >= self.log_interval):
+                suppressed = self._suppressed
+                self._log_window = now
+                self._logged = self._suppressed = 0
+            if self._logged >= self.log_limit:
+                self._suppressed += 1
+                return
+            self._logged += 1
+
+        if suppressed:
+            logging.warning('Failed to parse datetime %s (and %d more since '
+                            'the last message)', date_str, suppressed)
+        else:
+            logging.warning('Failed to parse datetime %s', date_str)
+
+    def snapshot(self):
+        """The current value of every counter, as a dict"""
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['datetime_failure_patterns'] = dict(self._patterns)
+            snapshot['max_depth'] = self._max_depth
+        return snapshot
+
+    def reset(self):
+        """Set every counter back to zero, and return their values from
+        before, so no count is lost between a snapshot and a reset"""
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['datetime_failure_patterns'] = self._patterns
+            snapshot['max_depth'] = self._max_depth
+            self._clear()
+        return snapshot
+
+
+_DIGITS_RE = re.compile(r'[0-9]+')
+_NOT_DIGITS_RE = re.compile(r'[^\W\d_]+', re.UNICODE)
+
+metrics = Metrics()
+
+
+def _call_traced(tracer, stage, item, depth, func, *args):
+    """Call func(*args) between the tracer's start and end events for
+    `stage`, or just call it if there is no tracer"""
+    if tracer is None:
+        return func(*args)
+    types = item.get('type') if item else None
+    item_type = types[0] if types else None
+    tracer.start(stage, item_type, depth)
+    try:
+        return func(*args)
+    finally:
+        tracer.end(stage, item_type, depth)
+
+
+class _InterpretContext(object):
+    """Document-level facts shared by every item interpreted from the
+    same parsed document (and the options of the call that is
+    interpreting it), so they are computed once per document instead of
+    once per entry.
+    """
+
+    def __init__(self, parsed, source_url, base_href=None, want_json=False,
+                 fetch_mf2_func=None, memoize_by_url=False, cite_cache=None,
+                 limits=None, tracer=None):
+        self.parsed = parsed
+        self.source_url = source_url
+        self.base_href = base_href
+        self.want_json = want_json
+        self.fetch_mf2_func = fetch_mf2_func
+        self.memoize_by_url = memoize_by_url
+        self.cite_cache = cite_cache
+        self.limits = limits or Limits()
+        self.tracer = tracer
+        # interpreted nested items, keyed by id() and optionally url
+        self.nested = {}
+        # current (and deepest) nesting depth, items interpreted, and limits
+        # hit so far
+        self.depth = 0
+        self.deepest = 0
+        self.items = 0
+        self.truncations = 0
+
+        rels = parsed.get('rels', {})
+        # order matters for these two, so keep them as lists
+        self.rel_authors = list(rels.get('author', []))
+        self.rel_syndication = list(rels.get('syndication', []))
+
+        if source_url and base_href:
+            self.base_url = urljoin(source_url, base_href)
+        else:
+            self.base_url = source_url
+
+        self._hfeeds = None
+        self._parent_hfeeds = None
+        # fingerprints of the document's dicts and lists, see _tree_facts
+        self._facts = {}
+
+    def call(self, stage, item, func, *args):
+        """Call func(*args), reporting it to the tracer as `stage` of
+        interpreting `item` if there is one"""
+        if self.tracer is None:
+            return func(*args)
+        return _call_traced(self.tracer, stage, item, self.depth, func, *args)
+
+    def can_nest(self):
+        """True if the limits allow interpreting another nested item"""
+        limits = self.limits
+        return ((limits.max_depth is None or self.depth < limits.max_depth)
+                and (limits.max_items is None
+                     or self.items < limits.max_items))
+
+    def truncate(self, result):
+        """Flag `result` as incomplete because a limit was hit"""
+        self.truncations += 1
+        result['truncated'] = True
+
+    @property
+    def hfeeds(self):
+        """All h-feeds in the document in BFS-order"""
+        if self._hfeeds is None:
+            self._hfeeds = list(_find_all_entries(
+                self.parsed, ['h-feed'], False))
+        return self._hfeeds
+
+    def first_hfeed(self):
+        return self.hfeeds[0] if self.hfeeds else None
+
+    def parent_hfeeds(self, item):
+        """The h-feeds that contain `item` as a child, in BFS-order"""
+        if self._parent_hfeeds is None:
+            self._parent_hfeeds = {}
+            for hfeed in self.hfeeds:
+                for child in hfeed.get('children', []):
+                    self._parent_hfeeds.setdefault(id(child), []).append(hfeed)
+        parents = self._parent_hfeeds.get(id(item))
+        if parents is None:
+            if self.depth:
+                # nested items are never a feed's children
+                return []
+            # a copy of one of the document's items passed in by the
+            # caller, fall back to equality
+            parents = [hfeed for hfeed in self.hfeeds
+                       if item in hfeed.get('children', [])]
+        return parents
+
+    def cite_cache_key(self, item):
+        """Key for `item` in a :class:`CiteCache`. Besides the item itself,
+        its interpretation depends on want_json, on whether authors can
+        be fetched, on the base URL if it has HTML content that may
+        contain relative paths, and on the document's rel=author if it
+        has no author of its own.
+        """
+        fingerprint, has_html, missing_author = _tree_facts(
+            self._facts, item)
+        depends = [self.want_json, self.fetch_mf2_func is not None]
+        if has_html:
+            depends.append(self.base_url)
+        if self.rel_authors and missing_author:
+            depends.append(self.rel_authors[0])
+        return (get_plain_text(item.get('properties', {}).get('url')),
+                _fingerprint(depends), fingerprint)
+
+
+class _LRUCache(object):
+    """A thread-safe mapping that holds at most `maxsize` items, evicting
+    the least recently used.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CiteCache(_LRUCache):
+    """A cache of interpreted reply contexts and comments (the nested
+    items under in-reply-to, like-of, comment, etc.) that can be shared
+    between calls to the interpret_* functions, e.g. across a stream of
+    incoming webmentions. Items are keyed by their url and a fingerprint
+    of their properties, so an edited copy of a post is interpreted
+    again.
+
+    Results are shared between every document that references the same
+    item, so they must not be modified.
+
+    :param int maxsize: the maximum number of results to hold
+    """
+
+
+class ResultCache(_LRUCache):
+    """An in-memory cache of the results of :func:`interpret`,
+    :func:`interpret_feed` and :func:`interpret_comment`, passed to them
+    as `result_cache`. Results are keyed by a hash of the whole parsed
+    document and the parameters that affect the result, so a page that
+    is fetched again with unchanged mf2 is not interpreted again.
+
+    Results are kept pickled, so each hit returns a fresh copy that the
+    caller may modify, and a cached result takes less memory.
+
+    :param int maxsize: the maximum number of results to hold
+    """
+
+    def get(self, key, default=None):
+        data = _LRUCache.get(self, key, _MISSING)
+        if data is _MISSING:
+            return default
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        _LRUCache.set(self, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+class SQLiteResultCache(object):
+    """Like :class:`ResultCache`, but kept in a local SQLite database, so
+    it can be shared between processes and runs. Results are pickled, so
+    only open databases written by a trusted process. There is no limit
+    on its size; use :meth:`clear` to empty it.
+
+    :param str path: the database file, created if needed
+    :param float timeout: (optional) seconds to wait for another process
+      that is writing to the database
+    """
+
+    def __init__(self, path, timeout=30.0):
+        import sqlite3
+        self._sqlite3 = sqlite3
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout,
+                                   check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS results '
+                             '(key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        return pickle.loads(bytes(row[0]))
+
+    def set(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?)',
+                             (key, self._sqlite3.Binary(data)))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM results')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._db.execute(
+                'SELECT 1 FROM results WHERE key = ?',
+                (key,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+_MISSING = object()
+
+
+def _result_cache_key(result_cache, fetch_mf2_func, method, parsed, *params):
+    """The key of a call's result in `result_cache`, or None if it is not
+    cached: there is no cache, the result depends on pages fetched with
+    `fetch_mf2_func`, or the arguments cannot be serialized (or are nested
+    too deeply to)."""
+    if result_cache is None or fetch_mf2_func is not None:
+        return None
+    params = [repr(param) if isinstance(param, Limits)
+              else sorted(param._urls) if isinstance(param, TargetMatcher)
+              else sorted(param) if isinstance(param, (set, frozenset))
+              else param for param in params]
+    try:
+        data = json.dumps([method, params, parsed], sort_keys=True,
+                          separators=(',', ':'), default=_json_default)
+    except (TypeError, ValueError, RuntimeError):
+        # RuntimeError is RecursionError on deeply nested documents
+        return None
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _cached_call(result_cache, key, func, *args, **kwargs):
+    """The result of func(*args, **kwargs), from the cache if it is there"""
+    result = result_cache.get(key, _MISSING)
+    if result is _MISSING:
+        metrics.add('result_cache_misses')
+        result = func(*args, **kwargs)
+        try:
+            result_cache.set(key, result)
+        except RuntimeError:
+            pass  # nested too deeply to pickle, leave it out
+    else:
+        metrics.add('result_cache_hits')
+    return result
+
+
+_CONTAINER_TYPES = _DICT_TYPES + (list, tuple)
+
+
+def _tree_facts(memo, root):
+    """(fingerprint, has HTML, missing author) of `root`, a dict in a mf2
+    document: a hash of its contents, whether any string in it may be
+    HTML, and whether it or any item nested in it has no author.
+
+    Every dict and list under `root` is hashed once, bottom-up and
+    without recursion, and its facts kept in `memo` by id(), so the
+    nested items of a reply chain reuse their children's fingerprints
+    instead of serializing their whole subtree again, and deep documents
+    cannot exhaust the stack.
+    """
+    stack = [root]
+    while stack:
+        node = stack[-1]
+        if id(node) in memo:
+            stack.pop()
+            continue
+        is_dict = isinstance(node, _DICT_TYPES)
+        values = list(node.values()) if is_dict else list(node)
+        pending = [value for value in values
+                   if isinstance(value, _CONTAINER_TYPES)
+                   and id(value) not in memo]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+
+        has_html = False
+        parts = []
+        for key in (sorted(node) if is_dict else range(len(values))):
+            value = node[key]
+            if isinstance(value, _CONTAINER_TYPES):
+                child = memo[id(value)]
+                has_html = has_html or child[1]
+                parts.append((key, child[0]))
+            else:
+                if isinstance(value, string_type) and '<' in value:
+                    has_html = True
+                parts.append((key, [value]))
+        fingerprint = _fingerprint(parts)
+
+        missing_author = False
+        props = node.get('properties') if is_dict else None
+        if isinstance(props, _DICT_TYPES):
+            missing_author = not props.get('author') or any(
+                memo[id(val)][2] for prop in NESTED_PROPERTIES
+                for val in props.get(prop, []) if isinstance(val, _DICT_TYPES))
+        # keep the node alive so its id() is not reused
+        memo[id(node)] = (fingerprint, has_html, missing_author, node)
+    return memo[id(root)][:3]
+
+
+def _interpret_common_properties(ctx, hentry, use_rel_syndication):
     result = {}
     props = hentry['properties']
+    ctx.items += 1
 
     for prop in ('url', 'uid', 'photo', 'featured' 'logo'):
         value = get_plain_text(props.get(prop))
@@ -544,36 +1488,43 @@ def _interpret_common_properties(
     for prop in ('start', 'end', 'published', 'updated', 'deleted'):
         date_str = get_plain_text(props.get(prop))
         if date_str:
-            if want_json:
+            if ctx.want_json:
                 result[prop] = date_str
             else:
                 result[prop + '-str'] = date_str
                 try:
-                    date = parse_datetime(date_str)
+                    date = ctx.call('datetime', hentry, parse_datetime,
+                                    date_str)
                     if date:
                         result[prop] = date
                 except ValueError:
-                    logging.warn('Failed to parse datetime %s', date_str)
+                    metrics.datetime_failure(date_str)
 
-    author = find_author(parsed, source_url, hentry, fetch_mf2_func)
+    author = ctx.call('author', hentry, _find_author, ctx, hentry)
     if author:
         result['author'] = author
 
     content_prop = props.get('content')
     content_value = None
     if content_prop:
-        if isinstance(content_prop[0], dict):
+        if isinstance(content_prop[0], _DICT_TYPES):
             content_html = content_prop[0].get('html', '').strip()
             content_value = content_prop[0].get('value', '').strip()
         else:
             content_value = content_html = content_prop[0]
-        result['content'] = convert_relative_paths_to_absolute(
-            source_url, base_href, content_html)
+        max_length = ctx.limits.max_content_length
+        if max_length is not None and len(content_html) > max_length:
+            result['content'] = content_html
+            ctx.truncate(result)
+        else:
+            result['content'] = ctx.call(
+                'content', hentry, _convert_relative_paths, ctx.base_url,
+                content_html)
         result['content-plain'] = content_value
 
     summary_prop = props.get('summary')
     if summary_prop:
-        if isinstance(summary_prop[0], dict):
+        if isinstance(summary_prop[0], _DICT_TYPES):
             result['summary'] = summary_prop[0]['value']
         else:
             result['summary'] = summary_prop[0]
@@ -594,7 +1545,7 @@ def _interpret_common_properties(
 
     geo = props.get('geo')
     if geo:
-        if isinstance(geo[0], dict):
+        if isinstance(geo[0], _DICT_TYPES):
             location_stack.append(geo[0].get('properties', {}))
         else:
             if geo[0].startswith('geo:'):
@@ -610,21 +1561,24 @@ def _interpret_common_properties(
     for prop in LOCATION_PROPERTIES:
         for obj in location_stack:
             if obj and obj.get(prop) and not (obj == props and prop == 'name'):
-                result.setdefault('location', {})[prop] = obj[prop][0]
+                result.setdefault('location', {})[prop] = _from_compact(
+                    obj[prop][0])
 
     if use_rel_syndication:
         result['syndication'] = list(set(
-            parsed.get('rels', {}).get('syndication', []) +
-            hentry['properties'].get('syndication', [])))
+            ctx.rel_syndication +
+            list(hentry['properties'].get('syndication', []))))
     else:
-        result['syndication'] = hentry['properties'].get('syndication', [])
+        result['syndication'] = list(
+            hentry['properties'].get('syndication', []))
 
     return result
 
 
 def interpret_event(
         parsed, source_url, base_href=None, hevent=None,
-        use_rel_syndication=True, want_json=False, fetch_mf2_func=None):
+        use_rel_syndication=True, want_json=False, fetch_mf2_func=None,
+        limits=None, want_records=False, tracer=None):
     """Given a document containing an h-event, return a dictionary::
 
         {
@@ -650,17 +1604,33 @@ def interpret_event(
       will be pure json with datetimes as strings instead of python objects
     :param callable fetch_mf2_func: (optional) function to fetch mf2 parsed
       output for a given URL.
+    :param Limits limits: (optional) caps on the work done for a single
+      document, see :class:`Limits`
+    :param boolean want_records: (optional, default False) if true, the
+      result is made of immutable, dict-like records (see
+      :class:`EntryRecord`) that take less memory than dicts
+    :param tracer: (optional) an object whose `start` and `end` methods
+      are called around each stage of the interpretation, e.g. a
+      :class:`StageTimer`
     :return: a dict with some or all of the described properties
     """
     # find the h-event if it wasn't provided
     if not hevent:
-        hevent = find_first_entry(parsed, ['h-event'])
+        hevent = _call_traced(tracer, 'find', None, 0, find_first_entry,
+                              parsed, ['h-event'])
         if not hevent:
             return {}
 
-    result = _interpret_common_properties(
-        parsed, source_url, base_href, hevent, use_rel_syndication, want_json,
-        fetch_mf2_func)
+    ctx = _InterpretContext(parsed, source_url, base_href, want_json,
+                            fetch_mf2_func, limits=limits, tracer=tracer)
+    result = _finish(ctx, ctx.call(
+        'interpret', hevent, _interpret_event, ctx, hevent,
+        use_rel_syndication))
+    return _to_record(result) if want_records else result
+
+
+def _interpret_event(ctx, hevent, use_rel_syndication):
+    result = _interpret_common_properties(ctx, hevent, use_rel_syndication)
     result['type'] = 'event'
     name_value = get_plain_text(hevent['properties'].get('name'))
     if name_value:
@@ -670,7 +1640,9 @@ def interpret_event(
 
 def interpret_entry(
         parsed, source_url, base_href=None, hentry=None,
-        use_rel_syndication=True, want_json=False, fetch_mf2_func=None):
+        use_rel_syndication=True, want_json=False, fetch_mf2_func=None,
+        memoize_by_url=False, cite_cache=None, limits=None,
+        want_records=False, tracer=None):
     """Given a document containing an h-entry, return a dictionary::
 
         {
@@ -709,36 +1681,80 @@ def interpret_entry(
       will be pure json with datetimes as strings instead of python objects
     :param callable fetch_mf2_func: (optional) function to fetch mf2 parsed
       output for a given URL.
+    :param boolean memoize_by_url: (optional, default False) if true, nested
+      reply contexts and comments that have the same url are only
+      interpreted once, and share the result of the first one
+    :param CiteCache cite_cache: (optional) a cache of interpreted reply
+      contexts and comments that can be shared between calls, so an item
+      that is referenced from many documents is only interpreted once
+    :param Limits limits: (optional) caps on the work done for a single
+      document, see :class:`Limits`
+    :param boolean want_records: (optional, default False) if true, the
+      result is made of immutable, dict-like records (see
+      :class:`EntryRecord`) that take less memory than dicts
+    :param tracer: (optional) an object whose `start` and `end` methods
+      are called around each stage of the interpretation, e.g. a
+      :class:`StageTimer`
     :return: a dict with some or all of the described properties
     """
 
     # find the h-entry if it wasn't provided
     if not hentry:
-        hentry = find_first_entry(parsed, ['h-entry'])
+        hentry = _call_traced(tracer, 'find', None, 0, find_first_entry,
+                              parsed, ['h-entry'])
         if not hentry:
             return {}
 
-    result = _interpret_common_properties(
-        parsed, source_url, base_href, hentry, use_rel_syndication, want_json,
-        fetch_mf2_func)
+    ctx = _InterpretContext(parsed, source_url, base_href, want_json,
+                            fetch_mf2_func, memoize_by_url, cite_cache, limits,
+                            tracer)
+    result = _finish(ctx, ctx.call(
+        'interpret', hentry, _interpret_entry, ctx, hentry,
+        use_rel_syndication))
+    return _to_record(result) if want_records else result
+
+
+def _interpret_entry(ctx, hentry, use_rel_syndication):
+    result = _interpret_common_properties(ctx, hentry, use_rel_syndication)
     if 'h-cite' in hentry.get('type', []):
         result['type'] = 'cite'
     else:
         result['type'] = 'entry'
 
     title = get_plain_text(hentry['properties'].get('name'))
-    if title and is_name_a_title(title, result.get('content-plain')):
-        result['name'] = title
-
-    for prop in ('in-reply-to', 'like-of', 'repost-of', 'bookmark-of',
-                 'comment', 'like', 'repost'):
-        for url_val in hentry['properties'].get(prop, []):
-            if isinstance(url_val, dict):
-                result.setdefault(prop, []).append(
-                    interpret(parsed, source_url, base_href, url_val,
-                              use_rel_syndication=False,
-                              want_json=want_json,
-                              fetch_mf2_func=fetch_mf2_func))
+    if title:
+        content_plain = result.get('content-plain')
+        max_length = ctx.limits.max_content_length
+        if max_length is not None:
+            if (len(title) > max_length or
+                    (content_plain and len(content_plain) > max_length)):
+                ctx.truncate(result)
+            name_is_title = ctx.call(
+                'title', hentry, is_name_a_title, title[:max_length],
+                content_plain and content_plain[:max_length])
+        else:
+            name_is_title = ctx.call(
+                'title', hentry, is_name_a_title, title, content_plain)
+        if name_is_title:
+            result['name'] = title
+
+    max_children = ctx.limits.max_children
+    for prop in NESTED_PROPERTIES:
+        values = hentry['properties'].get(prop, [])
+        if max_children is not None and len(values) > max_children:
+            values = values[:max_children]
+            ctx.truncate(result)
+        for url_val in values:
+            if isinstance(url_val, _DICT_TYPES):
+                if ctx.can_nest():
+                    result.setdefault(prop, []).append(
+                        _interpret_nested(ctx, url_val))
+                else:
+                    ctx.truncate(result)
+                    url = get_plain_text(
+                        url_val.get('properties', {}).get('url'))
+                    if url:
+                        result.setdefault(prop, []).append({'url': url})
             else:
                 result.setdefault(prop, []).append({
                     'url': url_val,
@@ -747,8 +1763,56 @@ def interpret_entry(
     return result
 
 
+def _interpret_nested(ctx, item):
+    """Interpret a reply context, comment, etc. nested in another item.
+    Threads often repeat the same context on many entries, so each one
+    is only interpreted once per document and the result is shared.
+    """
+    keys = [id(item)]
+    if ctx.memoize_by_url:
+        url = get_plain_text(item.get('properties', {}).get('url'))
+        if url:
+            keys.append(url)
+
+    for key in keys:
+        result = ctx.nested.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+
+    ctx.depth += 1
+    ctx.deepest = max(ctx.deepest, ctx.depth)
+    try:
+        cache_key = result = _MISSING
+        if ctx.cite_cache is not None:
+            cache_key = ctx.cite_cache_key(item)
+            result = ctx.cite_cache.get(cache_key, _MISSING)
+        if result is _MISSING:
+            truncations = ctx.truncations
+            # dispatched here, and only through the tracer if there is one,
+            # so each level of nesting adds as few stack frames as possible
+            func = _interpret_func(item)
+            if func is None:
+                result = None
+            elif ctx.tracer is None:
+                result = func(ctx, item, False)
+            else:
+                result = _call_traced(ctx.tracer, 'interpret', item,
+                                      ctx.depth, func, ctx, item, False)
+            # a truncated result depends on this call's limits
+            if cache_key is not _MISSING and ctx.truncations == truncations:
+                ctx.cite_cache.set(cache_key, result)
+    finally:
+        ctx.depth -= 1
+
+    for key in keys:
+        ctx.nested[key] = result
+    return result
+
+
 def interpret_feed(parsed, source_url, base_href=None, hfeed=None,
-                   want_json=False, fetch_mf2_func=None):
+                   want_json=False, fetch_mf2_func=None, max_workers=None,
+                   memoize_by_url=False, cite_cache=None, limits=None,
+                   want_records=False, tracer=None, result_cache=None):
     """Interpret a source page as an h-feed or as an top-level collection
     of h-entries.
 
@@ -760,37 +1824,406 @@ def interpret_feed(parsed, source_url, base_href=None, hfeed=None,
         this will be used instead of the first h-feed on the page.
     :param callable fetch_mf2_func: (optional) function to fetch mf2 parsed
       output for a given URL.
+    :param int max_workers: (optional) if greater than 1, interpret the
+      feed's children in a pool of this many processes. The entries are
+      returned in the same order as the serial version. `fetch_mf2_func`
+      must be picklable (i.e. a module-level function) in this mode.
+    :param boolean memoize_by_url: (optional, default False) if true, nested
+      reply contexts and comments that have the same url are only
+      interpreted once, and share the result of the first one
+    :param CiteCache cite_cache: (optional) a cache of interpreted reply
+      contexts and comments that can be shared between calls, so an item
+      that is referenced from many documents is only interpreted once. Not used
+      when `max_workers` is given
+    :param Limits limits: (optional) caps on the work done for a single
+      document, see :class:`Limits`. With `max_workers`, the feed is
+      cut off after `max_items` items as in the serial version, but the
+      nested items of an entry are only limited by the items its own
+      process has interpreted
+    :param boolean want_records: (optional, default False) if true, the
+      entries are immutable, dict-like records (see :class:`EntryRecord`)
+      that take less memory than dicts
+    :param tracer: (optional) an object whose `start` and `end` methods
+      are called around each stage of the interpretation, e.g. a
+      :class:`StageTimer`. Not used when `max_workers` is given
+    :param ResultCache result_cache: (optional) a cache of results; if
+      the same document is interpreted again with the same parameters,
+      the cached result is returned. Not used with `fetch_mf2_func`
     :return: a dict containing 'entries', a list of entries, and possibly other
         feed properties (like 'name').
     """
+    key = _result_cache_key(result_cache, fetch_mf2_func, 'interpret_feed',
+                            parsed, source_url, base_href, hfeed, want_json,
+                            memoize_by_url, limits)
+    if key is not None:
+        result = _cached_call(
+            result_cache, key, interpret_feed, parsed, source_url,
+            base_href, hfeed, want_json, max_workers=max_workers,
+            memoize_by_url=memoize_by_url, cite_cache=cite_cache,
+            limits=limits, tracer=tracer)
+        if want_records:
+            memo = {}
+            result = dict(result, entries=[_to_record(entry, memo=memo)
+                                           for entry in result['entries']])
+        return result
+
     result = {}
-    # find the first feed if it wasn't provided
+    ctx = _InterpretContext(parsed, source_url, base_href, want_json,
+                            fetch_mf2_func, memoize_by_url, cite_cache, limits,
+                            tracer)
+    hfeed, name, children = ctx.call('find', None, _find_feed, ctx, hfeed)
+    if name is not None:
+        result['name'] = name
+
+    if max_workers and max_workers > 1 and len(children) > 1:
+        if limits and limits.max_children is not None:
+            if len(children) > limits.max_children:
+                children = children[:limits.max_children]
+                ctx.truncations += 1
+        result['entries'] = _interpret_feed_parallel(
+            ctx, hfeed, children, max_workers)
+    else:
+        result['entries'] = _interpret_feed_children(ctx, children)
+    if want_records:
+        memo = {}
+        result['entries'] = [_to_record(entry, memo=memo)
+                             for entry in result['entries']]
+    return _finish(ctx, result)
+
+
+def _find_feed(ctx, hfeed):
+    """The h-feed (the first one in the document, if `hfeed` is not
+    given), its name, and its children. Without an h-feed, the top-level
+    items are the feed's children."""
     if not hfeed:
-        hfeed = find_first_entry(parsed, ['h-feed'])
-
+        hfeed = ctx.first_hfeed()
     if hfeed:
         names = hfeed['properties'].get('name')
-        if names:
-            result['name'] = names[0]
-        children = hfeed.get('children', [])
-    # just use the top level 'items' as the feed children
+        return (hfeed, names[0] if names else None,
+                hfeed.get('children', []))
+    return None, None, ctx.parsed.get('items', [])
+
+
+def _interpret_feed_children(ctx, children):
+    return list(_iter_feed_children(ctx, children))
+
+
+def _iter_feed_children(ctx, children):
+    """Interpret a feed's children one at a time"""
+    limits = ctx.limits
+    if limits.max_children is not None and len(children) > limits.max_children:
+        children = children[:limits.max_children]
+        ctx.truncations += 1
+
+    for child in children:
+        if limits.max_items is not None and ctx.items >= limits.max_items:
+            ctx.truncations += 1
+            break
+        entry = _interpret(ctx, child, use_rel_syndication=False)
+        if entry:
+            yield entry
+
+
+# how many interpreted reply contexts and comments dump_feed keeps for
+# reuse by later entries
+DUMP_FEED_NESTED_ITEMS = 256
+
+
+def dump_feed(parsed, source_url, fp, base_href=None, hfeed=None,
+              fetch_mf2_func=None, memoize_by_url=False, cite_cache=None,
+              limits=None, lines=False, tracer=None):
+    """Interpret a feed like :func:`interpret_feed` with `want_json=True`,
+    writing each entry to `fp` as soon as it is interpreted, so that
+    neither the whole result nor its serialization is ever held in
+    memory. The output is the same as ``json.dump(interpret_feed(...,
+    want_json=True), fp)``.
+
+    :param dict parsed: the result of parsing a mf2 document
+    :param str source_url: the URL of the source document (used for authorship
+        discovery)
+    :param fp: a file-like object opened for writing, in text or binary mode
+    :param str base_href: (optional) the href value of the base tag
+    :param dict hfeed: (optional) the h-feed to be parsed. If provided,
+        this will be used instead of the first h-feed on the page.
+    :param callable fetch_mf2_func: (optional) function to fetch mf2 parsed
+      output for a given URL.
+    :param boolean memoize_by_url: (optional, default False) if true, nested
+      reply contexts and comments that have the same url are only
+      interpreted once while they are among the last
+      `DUMP_FEED_NESTED_ITEMS` interpreted
+    :param CiteCache cite_cache: (optional) a cache of interpreted reply
+      contexts and comments that can be shared between calls
+    :param Limits limits: (optional) caps on the work done for a single
+      document, see :class:`Limits`
+    :param boolean lines: (optional, default False) if true, write JSON
+      Lines instead: one entry per line, without the feed's name
+    :param tracer: (optional) an object whose `start` and `end` methods
+      are called around each stage of the interpretation, e.g. a
+      :class:`StageTimer`
+    :return: the number of entries written
+    """
+    write = _text_writer(fp)
+    ctx = _InterpretContext(parsed, source_url, base_href, True,
+                            fetch_mf2_func, memoize_by_url, cite_cache, limits,
+                            tracer)
+    # only remember the recently interpreted nested items, so memory does
+    # not grow with the size of the feed
+    ctx.nested = _LRUCache(DUMP_FEED_NESTED_ITEMS)
+    hfeed, name, children = ctx.call('find', None, _find_feed, ctx, hfeed)
+
+    count = 0
+    if lines:
+        for entry in _iter_feed_children(ctx, children):
+            write(json.dumps(entry) + '\n')
+            count += 1
+        metrics.add_document(ctx)
+        return count
+
+    write('{')
+    if name is not None:
+        write('"name": %s, ' % json.dumps(name))
+    write('"entries": [')
+    for entry in _iter_feed_children(ctx, children):
+        write((', ' if count else '') + json.dumps(entry))
+        count += 1
+    write(']')
+    if ctx.truncations:
+        write(', "truncated": true')
+    write('}')
+    metrics.add_document(ctx)
+    return count
+
+
+def _text_writer(fp):
+    """A function that writes text to `fp`, encoded as UTF-8 if `fp` is a
+    binary file"""
+    try:
+        fp.write('')
+    except TypeError:
+        return lambda text: fp.write(text.encode('utf-8'))
+    return fp.write
+
+
+def _interpret_feed_chunk(parsed, source_url, base_href, in_feed, want_json,
+                          fetch_mf2_func, memoize_by_url, limits):
+    """Worker for :func:`_interpret_feed_parallel`. `parsed` is a reduced
+    document holding only this worker's slice of the feed. Returns a list
+    of (entry, number of items interpreted for it) pairs, and the number
+    of limits hit."""
+    if in_feed:
+        children = parsed['items'][0]['children']
     else:
-        children = parsed.get('items', [])
+        children = parsed['items']
+    ctx = _InterpretContext(parsed, source_url, base_href, want_json,
+                            fetch_mf2_func, memoize_by_url, limits=limits)
+    entries = []
+    counted = 0
+    for entry in _iter_feed_children(ctx, children):
+        entries.append((entry, ctx.items - counted))
+        counted = ctx.items
+    return entries, ctx.truncations
+
+
+def _interpret_feed_parallel(ctx, hfeed, children, max_workers):
+    """Split a feed's children into chunks and interpret them in a process
+    pool. Each worker receives a reduced document: the document's rels, and
+    either the h-feed (so authorship can still fall back to the feed's
+    author) or the top-level items, limited to its own slice of children.
+    The workers' item counts and truncations are added to `ctx`, and the
+    entries are cut off at `max_items` like :func:`_iter_feed_children`.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    # a few chunks per worker evens out entries of uneven size
+    chunk_size = max(1, -(-len(children) // (max_workers * 4)))
+    rels = ctx.parsed.get('rels', {})
+    docs = []
+    for start in range(0, len(children), chunk_size):
+        chunk = children[start:start + chunk_size]
+        if hfeed:
+            items = [dict(hfeed, children=chunk)]
+        else:
+            items = chunk
+        docs.append({'items': items, 'rels': rels})
 
+    max_items = ctx.limits.max_items
     entries = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(
+            _interpret_feed_chunk, doc, ctx.source_url, ctx.base_href,
+            bool(hfeed), ctx.want_json, ctx.fetch_mf2_func,
+            ctx.memoize_by_url, ctx.limits)
+            for doc in docs]
+        for future in futures:
+            chunk, truncations = future.result()
+            ctx.truncations += truncations
+            for entry, items in chunk:
+                if max_items is not None and ctx.items >= max_items:
+                    ctx.truncations += 1
+                    for pending in futures:
+                        pending.cancel()
+                    return entries
+                entries.append(entry)
+                ctx.items += items
+    return entries
+
+
+def interpret_feed_incremental(parsed, source_url, state=None,
+                               base_href=None, hfeed=None, want_json=False,
+                               fetch_mf2_func=None):
+    """Interpret an h-feed that has been interpreted before, only doing the
+    work for entries that are new or have changed since the previous call.
+
+    Entries are identified by their uid, or url if there is no uid, and
+    compared by a fingerprint of their mf2 data. If the document-level
+    context (rels, the feed's own properties, source_url, or base_href)
+    changes, every entry is interpreted again. Returns a dict::
+
+        {
+         'name': the feed's name, if any,
+         'entries': interpreted entries that are new or changed, in feed order,
+         'removed': keys of entries that were in `state` but are gone,
+         'state': the state to pass to the next call,
+        }
+
+    :param dict parsed: the result of parsing a mf2 document
+    :param str source_url: the URL of the source document (used for authorship
+        discovery)
+    :param dict state: (optional) the 'state' returned by the previous call
+        for this feed. If omitted, every entry is considered new.
+    :param str base_href: (optional) the href value of the base tag
+    :param dict hfeed: (optional) the h-feed to be parsed. If provided,
+        this will be used instead of the first h-feed on the page.
+    :param boolean want_json: (optional, default False) If true, the result
+      will be pure json with datetimes as strings instead of python objects
+    :param callable fetch_mf2_func: (optional) function to fetch mf2 parsed
+      output for a given URL.
+    :return: a dict as described above
+    """
+    result = {}
+    ctx = _InterpretContext(parsed, source_url, base_href, want_json,
+                            fetch_mf2_func)
+    hfeed, name, children = _find_feed(ctx, hfeed)
+    if name is not None:
+        result['name'] = name
+
+    doc_fingerprint = _fingerprint([
+        source_url, base_href, want_json, parsed.get('rels', {}),
+        hfeed and hfeed.get('properties', {})])
+    old_entries = {}
+    if state and state.get('context') == doc_fingerprint:
+        old_entries = state.get('entries', {})
+
+    new_entries = {}
+    changed = []
     for child in children:
-        entry = interpret(
-            parsed, source_url, base_href, item=child,
-            use_rel_syndication=False, want_json=want_json,
-            fetch_mf2_func=fetch_mf2_func)
-        if entry:
-            entries.append(entry)
-    result['entries'] = entries
+        fingerprint = _fingerprint(child)
+        props = child.get('properties', {})
+        key = (get_plain_text(props.get('uid')) or
+               get_plain_text(props.get('url')))
+        if not key or key in new_entries:
+            key = fingerprint
+        new_entries[key] = fingerprint
+        if old_entries.get(key) != fingerprint:
+            changed.append(child)
+
+    result['entries'] = _interpret_feed_children(ctx, changed)
+    result['removed'] = [key for key in (state or {}).get('entries', {})
+                         if key not in new_entries]
+    result['state'] = {'context': doc_fingerprint, 'entries': new_entries}
+    metrics.add_document(ctx)
     return result
 
 
+def merge_timelines(feeds, limit=None, newest_first=True, dedupe_size=1024):
+    """Merge the entries of several feeds into one timeline, ordered by
+    their published date. Each feed must already be in that order, as
+    h-feeds normally are (use `newest_first=False` for feeds that are
+    oldest first). Only one entry per feed is held at a time, so feeds
+    can be generators that are read lazily, and when only the first
+    `limit` entries are needed the rest of each feed is never read.
+
+    Entries that appear in more than one feed are only yielded once,
+    the first time. They are recognized by uid, or url if there is no
+    uid; only the most recent `dedupe_size` of them are remembered, so a
+    duplicate that is far apart from the original in the timeline may
+    get through.
+
+    :param list feeds: iterables of interpreted entries, e.g. the
+      'entries' of :func:`interpret_feed`
+    :param int limit: (optional) stop after this many entries
+    :param boolean newest_first: (optional, default True) the order of
+      the feeds and of the timeline
+    :param int dedupe_size: (optional) the number of uids and urls to
+      remember for deduplication
+    :return: a generator of interpreted entries
+    """
+    heap = []
+    for index, feed in enumerate(feeds):
+        feed = iter(feed)
+        _push_timeline_entry(heap, feed, index, newest_first)
+
+    recent = OrderedDict()
+    count = 0
+    while heap and (limit is None or count < limit):
+        _, index, entry, feed = heapq.heappop(heap)
+        key = entry.get('uid') or entry.get('url')
+        if isinstance(key, string_type):
+            key = _canonical_url(key)
+            if key in recent:
+                entry = None
+            else:
+                recent[key] = None
+                if len(recent) > dedupe_size:
+                    recent.popitem(last=False)
+        if entry is not None:
+            count += 1
+            yield entry
+            if count == limit:
+                return
+        # read the feed's next entry only once this one has been used
+        _push_timeline_entry(heap, feed, index, newest_first)
+
+
+def _push_timeline_entry(heap, feed, index, newest_first):
+    """Put the next entry of `feed` in the heap, if it has one"""
+    for entry in feed:
+        published = _sortable_datetime(entry.get('published'))
+        sort_key = _Descending(published) if newest_first else published
+        # the feed's index breaks ties, so entries are never compared
+        heapq.heappush(heap, (sort_key, index, entry, feed))
+        return
+
+
+class _Descending(object):
+    """A sort key that orders values in reverse"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _fingerprint(obj):
+    """A short, stable hash of a json-compatible object (or of an
+    already serialized one)."""
+    if isinstance(obj, string_type):
+        data = obj
+    else:
+        data = json.dumps(obj, sort_keys=True, separators=(',', ':'),
+                          default=_json_default)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
 def interpret(parsed, source_url, base_href=None, item=None,
-              use_rel_syndication=True, want_json=False, fetch_mf2_func=None):
+              use_rel_syndication=True, want_json=False, fetch_mf2_func=None,
+              memoize_by_url=False, cite_cache=None, limits=None,
+              want_records=False, tracer=None, result_cache=None):
     """Interpret a permalink of unknown type. Finds the first interesting
     h-* element, and delegates to :func:`interpret_entry` if it is an
     h-entry or :func:`interpret_event` for an h-event
@@ -809,27 +2242,79 @@ def interpret(parsed, source_url, base_href=None, item=None,
       will be pure json with datetimes as strings instead of python objects
     :param callable fetch_mf2_func: (optional) function to fetch mf2 parsed
       output for a given URL.
+    :param boolean memoize_by_url: (optional, default False) if true, nested
+      reply contexts and comments that have the same url are only
+      interpreted once, and share the result of the first one
+    :param CiteCache cite_cache: (optional) a cache of interpreted reply
+      contexts and comments that can be shared between calls, so an item
+      that is referenced from many documents is only interpreted once
+    :param Limits limits: (optional) caps on the work done for a single
+      document, see :class:`Limits`
+    :param boolean want_records: (optional, default False) if true, the
+      result is made of immutable, dict-like records (see
+      :class:`EntryRecord`) that take less memory than dicts
+    :param tracer: (optional) an object whose `start` and `end` methods
+      are called around each stage of the interpretation, e.g. a
+      :class:`StageTimer`
+    :param ResultCache result_cache: (optional) a cache of results; if
+      the same document is interpreted again with the same parameters,
+      the cached result is returned. Not used with `fetch_mf2_func`
     :return: a dict as described by interpret_entry or interpret_event, or None
     """
+    key = _result_cache_key(result_cache, fetch_mf2_func, 'interpret',
+                            parsed, source_url, base_href, item,
+                            use_rel_syndication, want_json, memoize_by_url,
+                            limits)
+    if key is not None:
+        result = _cached_call(
+            result_cache, key, interpret, parsed, source_url, base_href,
+            item, use_rel_syndication, want_json,
+            memoize_by_url=memoize_by_url, cite_cache=cite_cache,
+            limits=limits, tracer=tracer)
+        return _to_record(result) if want_records and result else result
+
     if not item:
-        item = find_first_entry(parsed, ['h-entry', 'h-event'])
+        item = _call_traced(tracer, 'find', None, 0, find_first_entry,
+                            parsed, ['h-entry', 'h-event'])
 
     if item:
-        types = item.get('type', [])
-        if 'h-event' in types:
-            return interpret_event(
-                parsed, source_url, base_href=base_href, hevent=item,
-                use_rel_syndication=use_rel_syndication, want_json=want_json,
-                fetch_mf2_func=fetch_mf2_func)
-        elif 'h-entry' in types or 'h-cite' in types:
-            return interpret_entry(
-                parsed, source_url, base_href=base_href, hentry=item,
-                use_rel_syndication=use_rel_syndication, want_json=want_json,
-                fetch_mf2_func=fetch_mf2_func)
+        ctx = _InterpretContext(parsed, source_url, base_href, want_json,
+                                fetch_mf2_func, memoize_by_url, cite_cache,
+                                limits, tracer)
+        result = _finish(
+            ctx, _interpret(ctx, item, use_rel_syndication))
+        return _to_record(result) if want_records else result
+
+
+def _finish(ctx, result):
+    """Flag the top-level result if any limit was hit while interpreting
+    it, and add the document to the metrics"""
+    if result and ctx.truncations:
+        result['truncated'] = True
+    metrics.add_document(ctx)
+    return result
+
+
+def _interpret(ctx, item, use_rel_syndication):
+    func = _interpret_func(item)
+    if func:
+        return ctx.call('interpret', item, func, ctx, item,
+                        use_rel_syndication)
+
+
+def _interpret_func(item):
+    """The function that interprets `item`, by its type"""
+    types = item.get('type', [])
+    if 'h-event' in types:
+        return _interpret_event
+    elif 'h-entry' in types or 'h-cite' in types:
+        return _interpret_entry
 
 
 def interpret_comment(parsed, source_url, target_urls, base_href=None,
-                      want_json=False, fetch_mf2_func=None):
+                      want_json=False, fetch_mf2_func=None,
+                      memoize_by_url=False, cite_cache=None, limits=None,
+                      want_records=False, tracer=None, result_cache=None):
     """Interpret received webmentions, and classify as like, reply, or
     repost (or a combination thereof). Returns a dict as described
     in :func:`interpret_entry`, with the additional fields::
@@ -844,21 +2329,56 @@ def interpret_comment(parsed, source_url, target_urls, base_href=None,
     :param str source_url: the URL of the source document
     :param list target_urls: a collection containing the URL of the target\
       document, and any alternate URLs (e.g., shortened links) that should\
-      be considered equivalent when looking for references
+      be considered equivalent when looking for references, or a\
+      :class:`TargetMatcher`
     :param str base_href: (optional) the href value of the base tag
     :param boolean want_json: (optional, default False) If true, the result
       will be pure json with datetimes as strings instead of python objects
     :param callable fetch_mf2_func: (optional) function to fetch mf2 parsed
       output for a given URL.
+    :param boolean memoize_by_url: (optional, default False) if true, nested
+      reply contexts and comments that have the same url are only
+      interpreted once, and share the result of the first one
+    :param CiteCache cite_cache: (optional) a cache of interpreted reply
+      contexts and comments that can be shared between calls, so an item
+      that is referenced from many documents is only interpreted once
+    :param Limits limits: (optional) caps on the work done for a single
+      document, see :class:`Limits`
+    :param boolean want_records: (optional, default False) if true, the
+      result is made of immutable, dict-like records (see
+      :class:`EntryRecord`) that take less memory than dicts
+    :param tracer: (optional) an object whose `start` and `end` methods
+      are called around each stage of the interpretation, e.g. a
+      :class:`StageTimer`
+    :param ResultCache result_cache: (optional) a cache of results; if
+      the same document is interpreted again with the same parameters,
+      the cached result is returned. Not used with `fetch_mf2_func`
     :return: a dict as described above, or None
     """
-    item = find_first_entry(parsed, ['h-entry'])
+    key = _result_cache_key(result_cache, fetch_mf2_func,
+                            'interpret_comment', parsed, source_url,
+                            target_urls, base_href, want_json,
+                            memoize_by_url, limits)
+    if key is not None:
+        result = _cached_call(
+            result_cache, key, interpret_comment, parsed, source_url,
+            target_urls, base_href, want_json,
+            memoize_by_url=memoize_by_url, cite_cache=cite_cache,
+            limits=limits, tracer=tracer)
+        return _to_record(result) if want_records and result else result
+
+    item = _call_traced(tracer, 'find', None, 0, find_first_entry,
+                        parsed, ['h-entry'])
     if item:
-        result = interpret_entry(parsed, source_url, base_href=base_href,
-                                 hentry=item, want_json=want_json,
-                                 fetch_mf2_func=fetch_mf2_func)
+        ctx = _InterpretContext(parsed, source_url, base_href, want_json,
+                                fetch_mf2_func, memoize_by_url, cite_cache,
+                                limits, tracer)
+        result = _finish(ctx, ctx.call(
+            'interpret', item, _interpret_entry, ctx, item, True))
         if result:
-            result['comment_type'] = classify_comment(parsed, target_urls)
+            result['comment_type'] = ctx.call(
+                'classify', item, _classify_comment, item,
+                _target_set(target_urls))
             rsvp = get_plain_text(item['properties'].get('rsvp'))
             if rsvp:
                 result['rsvp'] = rsvp.lower()
@@ -868,4 +2388,611 @@ def interpret_comment(parsed, source_url, target_urls, base_href=None,
                 result['invitees'] = [
                     parse_author(inv) for inv in invitees]
 
+        return _to_record(result) if want_records and result else result
+
+
+class ResponseAggregator(object):
+    """Running counts of the responses (likes, reposts, replies, RSVPs,
+    ...) to each target post, kept up to date as webmentions arrive
+    instead of being recomputed from every stored mention.
+
+    Feed it the results of :func:`interpret_comment` with :meth:`add`.
+    Each (target, source URL) pair counts once; a new mention from the
+    same source replaces the previous one, and a mention whose source
+    has been deleted undoes it. An RSVP is counted under its response
+    (e.g. 'yes'), not as a reply, and only the latest RSVP of each
+    author is counted.
+
+    Each update takes constant time, apart from looking through the
+    other RSVPs of the same author to the same target.
+    """
+
+    def __init__(self):
+        # target -> {source_url: (timestamp, comment types, rsvp, author)}
+        self._mentions = {}
+        # target -> {comment type: count}
+        self._counts = {}
+        # target -> {author: {source_url: (timestamp, rsvp)}}
+        self._rsvps = {}
+        # target -> {rsvp: count}
+        self._rsvp_counts = {}
+
+    def add(self, target, source_url, comment):
+        """Record a webmention to `target` from `source_url`. Mentions
+        may arrive out of order: one that is older (by its published,
+        updated, or deleted date) than the mention already recorded from
+        the same source is ignored. A comment with a `deleted` date
+        undoes the previous mention, but is remembered so that an older
+        copy of it arriving late does not bring it back.
+
+        :param target: the target post, e.g. its URL
+        :param str source_url: the source of the webmention
+        :param dict comment: the result of :func:`interpret_comment`
+          (with or without want_json), or None if the source no longer
+          has an h-entry, which is the same as calling :meth:`remove`
+        :return: False if the mention was ignored because it is older
+          than the one already recorded, True otherwise
+        """
+        if not comment:
+            self.remove(target, source_url)
+            return True
+
+        timestamp = _response_timestamp(comment)
+        mentions = self._mentions.setdefault(target, {})
+        old = mentions.get(source_url)
+        if old and timestamp < old[0]:
+            return False
+
+        if comment.get('deleted'):
+            record = (timestamp, (), None, None)
+        else:
+            types = tuple(comment.get('comment_type', ()))
+            rsvp = comment.get('rsvp') if 'rsvp' in types else None
+            record = (timestamp, types, rsvp,
+                      _response_author(comment, source_url))
+        if old:
+            self._update(target, source_url, old, -1)
+        mentions[source_url] = record
+        self._update(target, source_url, record, 1)
+        return True
+
+    def remove(self, target, source_url):
+        """Forget the webmention to `target` from `source_url`, e.g. when
+        the source returns 410 Gone"""
+        old = self._mentions.get(target, {}).pop(source_url, None)
+        if old:
+            self._update(target, source_url, old, -1)
+
+    def _update(self, target, source_url, record, delta):
+        timestamp, types, rsvp, author = record
+        counts = self._counts.setdefault(target, {})
+        for comment_type in types:
+            if rsvp and comment_type in ('rsvp', 'reply'):
+                continue
+            counts[comment_type] = counts.get(comment_type, 0) + delta
+            if not counts[comment_type]:
+                del counts[comment_type]
+
+        if rsvp:
+            authors = self._rsvps.setdefault(target, {})
+            responses = authors.setdefault(author, {})
+            before = _latest_rsvp(responses)
+            if delta > 0:
+                responses[source_url] = (timestamp, rsvp)
+            else:
+                responses.pop(source_url, None)
+            after = _latest_rsvp(responses)
+            if not responses:
+                del authors[author]
+
+            if before != after:
+                rsvp_counts = self._rsvp_counts.setdefault(target, {})
+                if before:
+                    rsvp_counts[before] -= 1
+                    if not rsvp_counts[before]:
+                        del rsvp_counts[before]
+                if after:
+                    rsvp_counts[after] = rsvp_counts.get(after, 0) + 1
+
+    def counts(self, target):
+        """The number of responses to `target` of each comment type,
+        e.g. ``{'like': 3, 'reply': 1}``. Types with no responses are
+        left out."""
+        return dict(self._counts.get(target, {}))
+
+    def rsvp_counts(self, target):
+        """The number of authors whose latest RSVP to `target` is each
+        response, e.g. ``{'yes': 4, 'maybe': 1}``"""
+        return dict(self._rsvp_counts.get(target, {}))
+
+    def rsvps(self, target):
+        """The latest RSVP of each author to `target`, keyed by the
+        author's url (or name, or the source URL if the author is
+        unknown)"""
+        return dict((author, _latest_rsvp(responses))
+                    for author, responses
+                    in self._rsvps.get(target, {}).items())
+
+    def to_dict(self):
+        """A compact, json-compatible form of the aggregator, which can be
+        loaded again with :meth:`from_dict`. Only the latest mention from
+        each source is kept; the counts are rebuilt from them."""
+        return dict((target, dict(
+            (source_url, [timestamp, list(types), rsvp, author])
+            for source_url, (timestamp, types, rsvp, author)
+            in mentions.items()))
+            for target, mentions in self._mentions.items() if mentions)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load an aggregator saved with :meth:`to_dict`"""
+        aggregator = cls()
+        for target, mentions in data.items():
+            for source_url, record in mentions.items():
+                timestamp, types, rsvp, author = record
+                record = (timestamp, tuple(types), rsvp, author)
+                aggregator._mentions.setdefault(target, {})[source_url] = \
+                    record
+                aggregator._update(target, source_url, record, 1)
+        return aggregator
+
+
+def _response_timestamp(comment):
+    """The latest of a comment's published, updated and deleted dates, as
+    a string that sorts in time order (UTC, for datetimes that have a
+    timezone), or '' if it has none"""
+    timestamps = [_sortable_datetime(comment.get(prop))
+                  for prop in ('published', 'updated', 'deleted')]
+    return max(timestamps)
+
+
+def _sortable_datetime(value):
+    """A date, datetime, or mf2 date string as a string that sorts in time
+    order (in UTC, for datetimes that have a timezone), or '' if it is
+    missing or cannot be parsed"""
+    if isinstance(value, string_type):
+        try:
+            value = parse_datetime(value)
+        except ValueError:
+            value = None
+    if isinstance(value, datetime):
+        if value.tzinfo:
+            value = (value - value.utcoffset()).replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return ''
+
+
+def _response_author(comment, source_url):
+    """A key identifying the author of a comment, for keeping one RSVP
+    per author"""
+    author = comment.get('author') or {}
+    if author.get('url'):
+        return _canonical_url(author['url'])
+    return author.get('name') or source_url
+
+
+def _latest_rsvp(responses):
+    """The most recent of an author's {source_url: (timestamp, rsvp)}"""
+    if responses:
+        return max(responses.items(), key=lambda kv: (kv[1][0], kv[0]))[1][1]
+
+
+# properties of an interpreted entry that point to its parents, and to its
+# children, with the kind of edge they make in a thread
+_THREAD_PARENTS = (('in-reply-to', 'reply'), ('like-of', 'like'),
+                   ('repost-of', 'repost'))
+_THREAD_CHILDREN = (('comment', 'reply'), ('like', 'like'),
+                    ('repost', 'repost'))
+
+
+class ThreadIndex(object):
+    """An index of interpreted entries and the replies, likes and reposts
+    between them, for reconstructing conversation threads.
+
+    Feed it the results of :func:`interpret_entry`,
+    :func:`interpret_comment` or :func:`interpret` with :meth:`add`, in
+    any order. Entries are identified by their url and uid, compared in
+    canonical form (see :class:`TargetMatcher`). in-reply-to, like-of
+    and repost-of link an entry to its parents, and comment, like and
+    repost to its children; the reply contexts and comments nested in an
+    entry are indexed as well, unless a fuller version of them has been
+    added. Each edge is linked once, so adding an entry takes time
+    proportional to its number of edges, and the ancestors or
+    descendants of an entry are found without looking at the rest of
+    the index.
+    """
+
+    def __init__(self):
+        # key -> the interpreted entry
+        self._entries = {}
+        # url or uid -> key of the same entry, for those that are not keys
+        self._aliases = {}
+        # (child, parent) -> {edge type: number of entries declaring it}
+        self._edges = {}
+        # key -> {parent: None} and {child: None}, ordered sets
+        self._parents = {}
+        self._children = {}
+        # key -> the edges added along with that entry
+        self._declared = {}
+
+    def add(self, entry):
+        """Add an interpreted entry, replacing any earlier version of it
+        and the edges that version declared.
+
+        :param dict entry: an interpreted entry, event, or comment
+        :return: the canonical key of the entry, or None if it has
+          neither a url nor a uid and so cannot be indexed
+        """
+        key = self._identify(entry)
+        if key is None:
+            return None
+        for child, parent, edge_type in self._declared.pop(key, ()):
+            self._link(child, parent, edge_type, -1)
+
+        self._entries[key] = entry
+        edges = []
+        self._add_edges(key, entry, edges, set())
+        self._declared[self._resolve(key)] = edges
+        return self._resolve(key)
+
+    def _identify(self, entry):
+        names = []
+        for prop in ('url', 'uid'):
+            value = entry.get(prop)
+            if value and isinstance(value, string_type):
+                names.append(_canonical_url(value))
+        if not names:
+            return None
+        key = self._resolve(names[0])
+        for name in names[1:]:
+            other = self._resolve(name)
+            if other != key:
+                self._merge(other, key)
+        return key
+
+    def _resolve(self, name):
+        while name in self._aliases:
+            name = self._aliases[name]
+        return name
+
+    def _merge(self, old, new):
+        """Move everything known about `old` to `new`, once they turn out
+        to be the url and uid of the same entry"""
+        self._aliases[old] = new
+        if old in self._entries:
+            self._entries.setdefault(new, self._entries.pop(old))
+        if old in self._declared:
+            self._declared.setdefault(new, []).extend(self._declared.pop(old))
+        for parent in list(self._parents.pop(old, {})):
+            self._children[parent].pop(old)
+            for edge_type, count in self._edges.pop((old, parent)).items():
+                self._link(new, parent, edge_type, count)
+        for child in list(self._children.pop(old, {})):
+            self._parents[child].pop(old)
+            for edge_type, count in self._edges.pop((child, old)).items():
+                self._link(child, new, edge_type, count)
+
+    def _add_edges(self, key, entry, edges, seen):
+        if id(entry) in seen:
+            return
+        seen.add(id(entry))
+        for props, is_parent in ((_THREAD_PARENTS, True),
+                                 (_THREAD_CHILDREN, False)):
+            for prop, edge_type in props:
+                for value in entry.get(prop, []):
+                    other = self._add_nested(value, edges, seen)
+                    if other is None:
+                        continue
+                    edge = ((key, other, edge_type) if is_parent
+                            else (other, key, edge_type))
+                    edges.append(edge)
+                    self._link(*edge, delta=1)
+
+    def _add_nested(self, value, edges, seen):
+        if isinstance(value, string_type):
+            value = {'url': value}
+        # a dict, or a record from want_records=True
+        if not isinstance(value, Mapping):
+            return None
+        key = self._identify(value)
+        if key is None:
+            return None
+        # a reply context does not replace an entry that was added itself
+        self._entries.setdefault(key, value)
+        self._add_edges(key, value, edges, seen)
+        return key
+
+    def _link(self, child, parent, edge_type, delta):
+        child, parent = self._resolve(child), self._resolve(parent)
+        if child == parent:
+            return
+        types = self._edges.setdefault((child, parent), {})
+        count = types.get(edge_type, 0) + delta
+        if count:
+            types[edge_type] = count
+        else:
+            types.pop(edge_type, None)
+
+        if types:
+            self._parents.setdefault(child, {})[parent] = None
+            self._children.setdefault(parent, {})[child] = None
+        else:
+            del self._edges[(child, parent)]
+            self._parents[child].pop(parent, None)
+            self._children[parent].pop(child, None)
+
+    def _key(self, url):
+        if isinstance(url, string_type):
+            return self._resolve(_canonical_url(url))
+
+    def get(self, url):
+        """The entry with this url or uid, or None. For an entry that has
+        only been seen as a reply context, this is the reply context."""
+        return self._entries.get(self._key(url))
+
+    def ancestors(self, url, types=None):
+        """The entries that the entry with this url or uid replies to,
+        likes, or reposts, and theirs in turn, nearest first.
+
+        :param str url: the url or uid of an entry
+        :param types: (optional) only follow these kinds of edges, some
+          of 'reply', 'like', 'repost'
+        :return: a list of interpreted entries
+        """
+        return self._walk(url, self._parents, types, upward=True)
+
+    def descendants(self, url, types=None):
+        """The replies, likes, and reposts of the entry with this url or
+        uid, and their replies etc. in turn, nearest first.
+
+        :param str url: the url or uid of an entry
+        :param types: (optional) only follow these kinds of edges, some
+          of 'reply', 'like', 'repost'
+        :return: a list of interpreted entries
+        """
+        return self._walk(url, self._children, types, upward=False)
+
+    def _walk(self, url, links, types, upward):
+        start = self._key(url)
+        seen = set([start])
+        queue = deque([start])
+        result = []
+        while queue:
+            key = queue.popleft()
+            for other in links.get(key, ()):
+                if other in seen:
+                    continue
+                if types is not None:
+                    edge = (key, other) if upward else (other, key)
+                    if not any(t in types for t in self._edges[edge]):
+                        continue
+                seen.add(other)
+                queue.append(other)
+                result.append(self._entries[other])
         return result
+
+    def __contains__(self, url):
+        return self._key(url) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _slot_names(fields):
+    return tuple(field.replace('-', '_') for field in fields)
+
+
+class _Record(Mapping):
+    """Base of the immutable records returned by the interpret methods
+    with `want_records=True`. A record can be read like the dict it
+    replaces (``record['content-plain']``, `get`, `items`, `in`, ...) or
+    by attribute, with '-' replaced by '_' (``record.content_plain``).
+    Lists become tuples. Keys that a record type has no slot for are
+    kept in a small dict, so no value is lost.
+
+    Records cannot be modified after they are created, so they can be
+    shared between threads (and between the results of different calls)
+    without copying.
+    """
+    __slots__ = ('_extra',)
+    FIELDS = ()
+    _SLOTS = {}
+
+    def __init__(self, values):
+        extra = None
+        for key, value in values.items():
+            slot = self._SLOTS.get(key)
+            if slot:
+                object.__setattr__(self, slot, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        object.__setattr__(self, '_extra', extra)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s is immutable' % type(self).__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError('%s is immutable' % type(self).__name__)
+
+    def __getitem__(self, key):
+        slot = self._SLOTS.get(key)
+        if slot:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for field, slot in zip(self.FIELDS, self.__slots__):
+            if hasattr(self, slot):
+                yield field
+        if self._extra:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __reduce__(self):
+        return self.__class__, (dict(self.items()),)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, dict(self.items()))
+
+    def to_dict(self):
+        """The record as the dict that the interpret methods return
+        without `want_records`"""
+        return _from_record(self)
+
+
+class EntryRecord(_Record):
+    """An interpreted h-entry or h-cite, see :func:`interpret_entry` and
+    :func:`interpret_comment`"""
+    FIELDS = (
+        'type', 'url', 'uid', 'photo', 'name', 'author', 'published',
+        'published-str', 'updated', 'updated-str', 'content',
+        'content-plain', 'summary', 'location', 'syndication',
+        'in-reply-to', 'like-of', 'repost-of', 'bookmark-of', 'comment',
+        'like', 'repost', 'comment_type', 'rsvp', 'invitees', 'truncated')
+    __slots__ = _slot_names(FIELDS)
+    _SLOTS = dict(zip(FIELDS, __slots__))
+
+
+class EventRecord(_Record):
+    """An interpreted h-event, see :func:`interpret_event`"""
+    FIELDS = (
+        'type', 'url', 'uid', 'photo', 'name', 'author', 'start',
+        'start-str', 'end', 'end-str', 'published', 'published-str',
+        'updated', 'updated-str', 'content', 'content-plain', 'summary',
+        'location', 'syndication', 'truncated')
+    __slots__ = _slot_names(FIELDS)
+    _SLOTS = dict(zip(FIELDS, __slots__))
+
+
+class AuthorRecord(_Record):
+    """An author or invitee, see :func:`parse_author`"""
+    FIELDS = ('name', 'photo', 'url')
+    __slots__ = _slot_names(FIELDS)
+    _SLOTS = dict(zip(FIELDS, __slots__))
+
+
+class LocationRecord(_Record):
+    """The location of an entry or event"""
+    FIELDS = tuple(sorted(LOCATION_PROPERTIES))
+    __slots__ = _slot_names(FIELDS)
+    _SLOTS = dict(zip(FIELDS, __slots__))
+
+
+class ReferenceRecord(_Record):
+    """A reply context, like, etc. that is only known by its url"""
+    FIELDS = ('url',)
+    __slots__ = _slot_names(FIELDS)
+    _SLOTS = dict(zip(FIELDS, __slots__))
+
+
+def _to_record(value, key=None, memo=None):
+    """Convert an interpreted result to records. Items shared between
+    several places in the result (e.g. the same reply context) stay
+    shared, and equal authors are converted to a single record.
+    """
+    if memo is None:
+        memo = {}
+    # convert bottom-up with a stack of pending values rather than by
+    # recursion, so a deep chain of reply contexts does not hit the
+    # recursion limit; converted values are pushed onto `done` in order
+    stack = [(value, key, False)]
+    done = []
+    while stack:
+        value, key, children_done = stack.pop()
+        if isinstance(value, list):
+            if children_done:
+                done.append(tuple(_pop_values(done, len(value))))
+            else:
+                stack.append((value, key, True))
+                stack.extend((item, key, False) for item in reversed(value))
+        elif not isinstance(value, dict):
+            done.append(value)
+        elif id(value) in memo:
+            done.append(memo[id(value)][1])
+        elif children_done:
+            record = _new_record(value, key, dict(zip(
+                value, _pop_values(done, len(value)))), memo)
+            # keep the dict alive so its id() is not reused during the
+            # conversion
+            memo[id(value)] = (value, record)
+            done.append(record)
+        else:
+            stack.append((value, key, True))
+            stack.extend((v, k, False)
+                         for k, v in reversed(list(value.items())))
+    return done[0]
+
+
+def _new_record(value, key, values, memo):
+    """The record for the dict `value`, found under `key`, given its
+    converted `values`"""
+    if key in ('author', 'invitees'):
+        try:
+            author_key = ('author',) + tuple(sorted(value.items()))
+            hash(author_key)
+        except TypeError:
+            return AuthorRecord(values)
+        if author_key not in memo:
+            memo[author_key] = AuthorRecord(values)
+        return memo[author_key]
+    elif key == 'location':
+        record_type = LocationRecord
+    elif value.get('type') == 'event':
+        record_type = EventRecord
+    elif key in NESTED_PROPERTIES and list(value) == ['url']:
+        record_type = ReferenceRecord
+    else:
+        record_type = EntryRecord
+    return record_type(values)
+
+
+def _from_record(value):
+    """Convert records back to dicts, and tuples to lists"""
+    stack = [(value, False)]
+    done = []
+    while stack:
+        value, children_done = stack.pop()
+        if isinstance(value, _Record):
+            if children_done:
+                keys = list(value)
+                done.append(dict(zip(keys, _pop_values(done, len(keys)))))
+            else:
+                stack.append((value, True))
+                stack.extend((item, False)
+                             for item in reversed(list(value.values())))
+        elif isinstance(value, tuple):
+            if children_done:
+                done.append(_pop_values(done, len(value)))
+            else:
+                stack.append((value, True))
+                stack.extend((item, False) for item in reversed(value))
+        else:
+            done.append(value)
+    return done[0]
+
+
+def _pop_values(values, count):
+    """Remove the last `count` items from the list `values` and return
+    them"""
+    start = len(values) - count
+    popped = values[start:]
+    del values[start:]
+    return popped
+
+
+if __name__ == '__main__':
+    # python -m mf2util: interpret JSON Lines in bulk, see mf2util_cli
+    import mf2util_cli
+    sys.exit(mf2util_cli.main())
@@ -0,0 +1,242 @@
+"""An asyncio pipeline for processing received webmentions with mf2util.
+
+Each mention goes through the stages fetch (download the source),
+parse (turn it into mf2 with a pluggable parser, e.g. mf2py),
+interpret (:func:`mf2util.interpret_comment`, which also classifies
+the mention), and emit (hand the result to the application). Stages are
+connected by bounded queues, so a slow stage holds back the ones before
+it instead of letting work pile up in memory, and each stage has its own
+number of workers.
+
+Requires Python 3.7+; :mod:`mf2util` itself does not import this
+module.
+"""
+
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+
+import mf2util
+
+STAGES = ('fetch', 'parse', 'interpret', 'emit')
+
+DEFAULT_CONCURRENCY = {'fetch': 10, 'parse': 2, 'interpret': 2, 'emit': 1}
+DEFAULT_RETRIES = {'fetch': 2}
+
+_DONE = object()
+_MISSING = object()
+
+
+class LatencyHistogram(object):
+    """Counts of latencies in fixed buckets, in seconds. `counts[i]` is
+    the number of latencies <= `bounds[i]`, and the last count is for
+    latencies above every bound.
+    """
+
+    BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+              1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def to_dict(self):
+        return {'bounds': list(self.bounds), 'counts': list(self.counts),
+                'count': self.count, 'total': self.total}
+
+
+class WebmentionPipeline(object):
+    """Process webmentions concurrently: fetch, parse, interpret, emit.
+
+    :param callable fetch: takes a source URL and returns its HTML. May
+      be a coroutine function; otherwise it is run in the executor.
+    :param callable parse: takes the HTML and the source URL and returns
+      the mf2 parsed dict, e.g.
+      ``lambda html, url: mf2py.parse(doc=html, url=url)``. May be a
+      coroutine function; otherwise it is run in the executor.
+    :param callable emit: takes the source URL, the target URLs, and the
+      result of :func:`mf2util.interpret_comment`. May be a coroutine
+      function; otherwise it is run in the executor.
+    :param callable fetch_mf2_func: (optional) passed on to
+      interpret_comment for authorship discovery. Results are cached in
+      an LRU cache shared by every mention the pipeline processes.
+    :param dict concurrency: (optional) number of workers per stage,
+      overriding `DEFAULT_CONCURRENCY`
+    :param dict retries: (optional) number of retries per stage after
+      an exception, overriding `DEFAULT_RETRIES` (by default only fetch
+      is retried)
+    :param float retry_delay: (optional) seconds to wait before the first
+      retry, doubled for each following one
+    :param int queue_size: (optional) the number of mentions that may wait
+      between two stages
+    :param int author_cache_size: (optional) the number of author pages
+      kept in the cache
+    :param callable on_error: (optional) called with the source URL, the
+      stage, and the exception when a mention fails for good. Failures
+      are logged either way.
+    :param executor: (optional) a concurrent.futures executor for the
+      synchronous callables and for interpretation. The default is the
+      event loop's default executor.
+    :param interpret_kwargs: passed on to :func:`mf2util.interpret_comment`,
+      e.g. `want_json`, `limits` or `cite_cache`
+    """
+
+    def __init__(self, fetch, parse, emit, fetch_mf2_func=None,
+                 concurrency=None, retries=None, retry_delay=0.5,
+                 queue_size=100, author_cache_size=1024, on_error=None,
+                 executor=None, **interpret_kwargs):
+        self.fetch = fetch
+        self.parse = parse
+        self.emit = emit
+        self.concurrency = dict(DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.retries = dict(DEFAULT_RETRIES, **(retries or {}))
+        self.retry_delay = retry_delay
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.executor = executor
+        self.interpret_kwargs = interpret_kwargs
+        self.latency = dict((stage, LatencyHistogram()) for stage in STAGES)
+        self.processed = 0
+        self.failed = dict((stage, 0) for stage in STAGES)
+
+        self.author_cache = mf2util._LRUCache(author_cache_size)
+        # one lock per author page being fetched, so concurrent mentions
+        # by the same author wait for a single fetch
+        self._author_locks = {}
+        self._author_locks_lock = threading.Lock()
+        self.fetch_mf2_func = None
+        if fetch_mf2_func:
+            self.fetch_mf2_func = functools.partial(
+                self._fetch_author, fetch_mf2_func)
+
+    def _fetch_author(self, fetch_mf2_func, url):
+        # a failed fetch returns None, which is cached too, so it is not
+        # retried for every mention by the same author
+        parsed = self.author_cache.get(url, _MISSING)
+        if parsed is not _MISSING:
+            return parsed
+        with self._author_locks_lock:
+            lock = self._author_locks.setdefault(url, threading.Lock())
+        with lock:
+            parsed = self.author_cache.get(url, _MISSING)
+            if parsed is _MISSING:
+                try:
+                    parsed = fetch_mf2_func(url)
+                    self.author_cache.set(url, parsed)
+                finally:
+                    with self._author_locks_lock:
+                        self._author_locks.pop(url, None)
+        return parsed
+
+    async def run(self, mentions):
+        """Process every mention and return once they have all been
+        emitted (or have failed).
+
+        :param mentions: an iterable or async iterable of
+          (source_url, target_urls) pairs, where target_urls is anything
+          :func:`mf2util.interpret_comment` accepts
+        """
+        queues = [asyncio.Queue(self.queue_size) for _ in STAGES]
+        queues.append(None)
+        stages = [
+            self._run_stage(stage, queues[ii], queues[ii + 1])
+            for ii, stage in enumerate(STAGES)]
+        await asyncio.gather(self._produce(mentions, queues[0]), *stages)
+
+    async def _produce(self, mentions, queue):
+        if hasattr(mentions, '__aiter__'):
+            async for source_url, target_urls in mentions:
+                await queue.put((source_url, target_urls, None))
+        else:
+            for source_url, target_urls in mentions:
+                await queue.put((source_url, target_urls, None))
+        for _ in range(self.concurrency[STAGES[0]]):
+            await queue.put(_DONE)
+
+    async def _run_stage(self, stage, inbox, outbox):
+        workers = self.concurrency[stage]
+        await asyncio.gather(*[
+            self._work(stage, inbox, outbox) for _ in range(workers)])
+        if outbox is not None:
+            next_stage = STAGES[STAGES.index(stage) + 1]
+            for _ in range(self.concurrency[next_stage]):
+                await outbox.put(_DONE)
+
+    async def _work(self, stage, inbox, outbox):
+        while True:
+            job = await inbox.get()
+            if job is _DONE:
+                return
+            source_url, target_urls, value = job
+            try:
+                value = await self._attempt(
+                    stage, source_url, target_urls, value)
+            except Exception as e:
+                self.failed[stage] += 1
+                logging.warning('webmention from %s failed in %s: %r',
+                                source_url, stage, e)
+                if self.on_error:
+                    self.on_error(source_url, stage, e)
+                continue
+            if outbox is not None:
+                await outbox.put((source_url, target_urls, value))
+            else:
+                self.processed += 1
+
+    async def _attempt(self, stage, source_url, target_urls, value):
+        retries = self.retries.get(stage, 0)
+        delay = self.retry_delay
+        while True:
+            start = time.monotonic()
+            try:
+                return await self._call_stage(
+                    stage, source_url, target_urls, value)
+            except Exception:
+                if retries <= 0:
+                    raise
+            finally:
+                self.latency[stage].add(time.monotonic() - start)
+            retries -= 1
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    def _call_stage(self, stage, source_url, target_urls, value):
+        if stage == 'fetch':
+            return self._call(self.fetch, source_url)
+        if stage == 'parse':
+            return self._call(self.parse, value, source_url)
+        if stage == 'interpret':
+            return self._call(functools.partial(
+                mf2util.interpret_comment, value, source_url, target_urls,
+                fetch_mf2_func=self.fetch_mf2_func, **self.interpret_kwargs))
+        return self._call(self.emit, source_url, target_urls, value)
+
+    async def _call(self, func, *args):
+        if inspect.iscoroutinefunction(func):
+            return await func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args))
+
+    def stats(self):
+        """Counts of processed and failed mentions, and the latency
+        histogram of each stage"""
+        return {
+            'processed': self.processed,
+            'failed': dict(self.failed),
+            'latency': dict((stage, hist.to_dict())
+                            for stage, hist in self.latency.items()),
+        }
@@ -0,0 +1,506 @@
+"""Interpret JSON Lines of parsed mf2 in bulk, in a process pool.
+
+    python -m mf2util [--method interpret|feed|comment] [--workers N]
+                      [--chunk-size 100] [--unordered] [--start N]
+                      [--progress SECONDS] [-o FILE] [FILE ...]
+
+Reads FILEs (or stdin, or '-') with one JSON object per line::
+
+    {"source_url": ..., "parsed": the result of parsing the page,
+     "base_href": (optional), "target_urls": (for --method comment)}
+
+and writes one JSON object per input record::
+
+    {"index": the record's position in the input, counting from 0,
+     "source_url": ...,
+     "result": the result of the interpret method (with want_json=True),
+     "error": instead of "result" if the record could not be interpreted}
+
+Records are sent to the workers in chunks of --chunk-size lines, and
+decoded, interpreted and encoded there. By default results are written in
+input order; with --unordered each chunk is written as soon as it is
+done. To resume an interrupted run, pass the resume offset from the last
+progress line (every record before it has been written) as --start, and
+drop any results with an index at or after it from the old output.
+With --index, a sidecar offset index (see :class:`JsonLinesFile`) is
+used to skip to --start without reading the records before it. With
+--cache, results are kept in a SQLite database shared by the workers
+(see :class:`mf2util.SQLiteResultCache`), and records whose document and
+parameters have been seen before are not interpreted again.
+"""
+from __future__ import print_function
+from array import array
+import argparse
+import io
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import deque, namedtuple
+
+import mf2util
+
+timer = getattr(time, 'perf_counter', time.time)
+
+METHODS = {
+    'interpret': 'interpret',
+    'feed': 'interpret_feed',
+    'comment': 'interpret_comment',
+}
+
+
+# each process's connection to the --cache database, by path
+_result_caches = {}
+
+
+def _result_cache(path):
+    if path is None:
+        return None
+    if path not in _result_caches:
+        _result_caches[path] = mf2util.SQLiteResultCache(path)
+    return _result_caches[path]
+
+
+def _interpret_line(index, line, method, target_urls, limits, cache_path):
+    source_url = None
+    try:
+        record = json.loads(line)
+        source_url = record.get('source_url')
+        args = [record['parsed'], source_url]
+        if method == 'interpret_comment':
+            args.append(record.get('target_urls') or target_urls)
+        result = getattr(mf2util, method)(
+            *args, base_href=record.get('base_href'), want_json=True,
+            limits=limits, result_cache=_result_cache(cache_path))
+        return json.dumps({'index': index, 'source_url': source_url,
+                           'result': result}), False
+    except Exception as e:
+        return json.dumps({'index': index, 'source_url': source_url,
+                           'error': '%s: %s' % (type(e).__name__, e)}), True
+
+
+def _interpret_chunk(start, lines, method, target_urls, limits,
+                     cache_path):
+    """Interpret a chunk of input lines, numbered from `start`. Returns
+    the output lines and the number of errors."""
+    output = []
+    errors = 0
+    for index, line in enumerate(lines, start):
+        out, failed = _interpret_line(index, line, method, target_urls,
+                                      limits, cache_path)
+        output.append(out)
+        errors += failed
+    return output, errors
+
+
+def _read_lines(paths, start, use_index=False):
+    """Non-blank lines of the input files in order, skipping the first
+    `start` of them. With `use_index`, files are skipped through their
+    offset index instead of being read."""
+    skip = start
+    for path in paths or ['-']:
+        if use_index and path != '-':
+            with JsonLinesFile(path) as corpus:
+                if skip >= len(corpus):
+                    skip -= len(corpus)
+                    continue
+                for line in corpus.iter_lines(skip):
+                    yield line
+                skip = 0
+            continue
+
+        if path == '-':
+            stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+            f = io.TextIOWrapper(stdin, encoding='utf-8')
+        else:
+            f = io.open(path, encoding='utf-8')
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                yield line
+
+
+def _chunks(lines, start, chunk_size):
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+# a byte range of a JSON Lines file, holding records [start, stop)
+Shard = namedtuple('Shard', ['path', 'start', 'stop', 'begin', 'end'])
+
+_WHITESPACE = (b' ', b'\t', b'\r', b'\x0b', b'\x0c')
+
+
+class JsonLinesFile(object):
+    """Random access to the records of a large JSON Lines file, through a
+    memory map of the file and an index of the byte offset of each
+    non-blank line::
+
+        with JsonLinesFile('archive.jsonl') as corpus:
+            record = corpus[8123441]
+            for record in corpus.iter_records(1000, 2000):
+                mf2util.interpret(record['parsed'], record['source_url'])
+
+    The index is kept next to the file (`path` + '.idx'), built on first
+    use, and rebuilt when the file's size or modification time changes.
+    If it cannot be written, it is only kept in memory.
+
+    :param str path: the JSON Lines file
+    :param str index_path: (optional) where to keep the index instead
+    """
+
+    INDEX_SUFFIX = '.idx'
+    # magic, file size, file modification time (ns), number of records
+    _HEADER = struct.Struct('<8sQQQ')
+    _MAGIC = b'MF2JLIX1'
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + self.INDEX_SUFFIX
+        self._file = open(path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._size = stat.st_size
+        self._mtime = stat.st_mtime_ns
+        # an empty file cannot be mapped
+        self._data = b''
+        if self._size:
+            self._data = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        self.offsets = self._load_index()
+        if self.offsets is None:
+            self.offsets = _line_offsets(self._data, 0, self._size)
+            self._save_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(self._HEADER.size)
+                if len(header) < self._HEADER.size:
+                    return None
+                magic, size, mtime, count = self._HEADER.unpack(header)
+                if (magic, size, mtime) != (self._MAGIC, self._size,
+                                            self._mtime):
+                    return None
+                offsets = array('Q')
+                offsets.fromfile(f, count)
+        except (IOError, OSError, EOFError):
+            return None
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        return offsets
+
+    def _save_index(self):
+        offsets = self.offsets
+        if sys.byteorder == 'big':
+            offsets = array('Q', offsets)
+            offsets.byteswap()
+        temp_path = '%s.%d.tmp' % (self.index_path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(self._HEADER.pack(self._MAGIC, self._size,
+                                          self._mtime, len(offsets)))
+                offsets.tofile(f)
+            os.replace(temp_path, self.index_path)
+        except (IOError, OSError):
+            # e.g. a read-only archive; keep the index in memory
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def close(self):
+        if self._size:
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def line(self, index):
+        """The bytes of the `index`th record, without decoding them"""
+        begin = self.offsets[index]
+        end = self._data.find(b'\n', begin)
+        return self._data[begin:end if end >= 0 else self._size]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[ii] for ii in range(*key.indices(len(self)))]
+        return json.loads(self.line(key).decode('utf-8'))
+
+    def iter_lines(self, start=0, stop=None):
+        """The decoded lines of records [start, stop), read lazily"""
+        for index in range(*slice(start, stop).indices(len(self))):
+            yield self.line(index).decode('utf-8')
+
+    def iter_records(self, start=0, stop=None):
+        """The records [start, stop), decoded lazily"""
+        for line in self.iter_lines(start, stop):
+            yield json.loads(line)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def shards(self, count):
+        """Split the records into at most `count` :class:`Shard` s of about
+        the same size in bytes, for :func:`iter_shard` to read in other
+        processes. Shards hold no data, only the file's path and offsets;
+        each process maps the file itself, so its pages are shared."""
+        offsets = self.offsets
+        bounds = [0]
+        for ii in range(1, count):
+            index = _bisect_offsets(offsets, self._size * ii // count)
+            if bounds[-1] < index < len(offsets):
+                bounds.append(index)
+        bounds.append(len(offsets))
+        return [Shard(self.path, start, stop,
+                      offsets[start] if start < len(offsets) else self._size,
+                      offsets[stop] if stop < len(offsets) else self._size)
+                for start, stop in zip(bounds, bounds[1:])
+                if start < stop or len(bounds) == 2]
+
+
+def _bisect_offsets(offsets, position):
+    """The index of the first record that starts at or after `position`"""
+    lo, hi = 0, len(offsets)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if offsets[mid] < position:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _line_offsets(data, begin, end):
+    """The offsets of the non-blank lines in data[begin:end]"""
+    offsets = array('Q')
+    pos = begin
+    while pos < end:
+        line_end = data.find(b'\n', pos, end)
+        if line_end < 0:
+            line_end = end
+        # only lines that start with whitespace need a closer look
+        if line_end > pos and (data[pos:pos + 1] not in _WHITESPACE or
+                               data[pos:line_end].strip()):
+            offsets.append(pos)
+        pos = line_end + 1
+    return offsets
+
+
+def iter_shard(shard):
+    """The records of a :class:`Shard`, decoded lazily. Does not need the
+    index."""
+    with open(shard.path, 'rb') as f:
+        if shard.begin >= shard.end:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for begin in _line_offsets(data, shard.begin, shard.end):
+                end = data.find(b'\n', begin, shard.end)
+                yield json.loads(
+                    data[begin:end if end >= 0 else shard.end].decode(
+                        'utf-8'))
+        finally:
+            data.close()
+
+
+class _Progress(object):
+    """Counts records written to `out`, and reports progress and
+    throughput on `err` every `interval` seconds (if given) and at the
+    end."""
+
+    def __init__(self, out, start, interval, err):
+        self.out = out
+        self.start = self.resume = start
+        self.interval = interval
+        self.err = err
+        self.records = self.errors = 0
+        self.began = self.reported = timer()
+        # chunks written ahead of the resume offset (in unordered mode)
+        self._done = {}
+
+    def add(self, start, output, errors):
+        self.records += len(output)
+        self.errors += errors
+        self._done[start] = start + len(output)
+        while self.resume in self._done:
+            self.resume = self._done.pop(self.resume)
+        if self.interval is not None:
+            now = timer()
+            if now - self.reported >= self.interval:
+                self.reported = now
+                self.report()
+
+    def report(self):
+        # the resume offset is only safe once the output is flushed
+        self.out.flush()
+        elapsed = timer() - self.began
+        print('%d records (%d errors) in %.1fs, %.1f records/s, '
+              'resume offset %d' % (
+                  self.records, self.errors, elapsed,
+                  self.records / elapsed if elapsed else 0.0, self.resume),
+              file=self.err)
+
+
+def run(paths, out, method='interpret', workers=None, chunk_size=100,
+        ordered=True, start=0, progress=None, err=sys.stderr,
+        target_urls=None, limits=None, use_index=False, cache_path=None):
+    """Interpret the records in the JSON Lines files `paths` and write the
+    results to the file-like `out`. Returns a :class:`_Progress` with the
+    counts of records and errors.
+
+    :param str method: 'interpret', 'feed', or 'comment'
+    :param int workers: (optional) number of worker processes; 1 runs
+      everything in this process. Defaults to the number of CPUs.
+    :param int chunk_size: (optional) number of records per task
+    :param bool ordered: (optional) write results in input order
+    :param int start: (optional) skip this many records
+    :param float progress: (optional) report progress on `err` every
+      this many seconds
+    :param list target_urls: (optional) target urls for 'comment', for
+      records that do not have their own
+    :param Limits limits: (optional) passed on to the interpret method
+    :param bool use_index: (optional) skip to `start` through each file's
+      :class:`JsonLinesFile` index, building it if needed
+    :param str cache_path: (optional) a SQLite database to cache results
+      in, see :class:`mf2util.SQLiteResultCache`
+    """
+    method = METHODS[method]
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(_read_lines(paths, start, use_index), start,
+                     chunk_size)
+    stats = _Progress(out, start, progress, err)
+
+    def write(chunk_start, result):
+        output, errors = result
+        for line in output:
+            out.write(line + '\n')
+        stats.add(chunk_start, output, errors)
+
+    if workers == 1:
+        for chunk_start, chunk in chunks:
+            write(chunk_start, _interpret_chunk(
+                chunk_start, chunk, method, target_urls, limits,
+                cache_path))
+        return stats
+
+    from concurrent.futures import (ProcessPoolExecutor, wait,
+                                    FIRST_COMPLETED)
+
+    # bound the chunks in flight, so a huge input is not read into memory
+    # ahead of the workers
+    max_pending = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk_start, chunk in chunks:
+            pending.append((chunk_start, executor.submit(
+                _interpret_chunk, chunk_start, chunk, method, target_urls,
+                limits, cache_path)))
+            if len(pending) < max_pending:
+                continue
+            if ordered:
+                chunk_start, future = pending.popleft()
+                write(chunk_start, future.result())
+            else:
+                wait([future for _, future in pending],
+                     return_when=FIRST_COMPLETED)
+                for item in [item for item in pending if item[1].done()]:
+                    pending.remove(item)
+                    write(item[0], item[1].result())
+        if not ordered:
+            wait([future for _, future in pending])
+        for chunk_start, future in pending:
+            write(chunk_start, future.result())
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mf2util',
+        description='Interpret JSON Lines of {"source_url", "parsed"} '
+        'records and write the results as JSON Lines.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help="input files, or '-' for stdin (the default)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="output file, or '-' for stdout (the default)")
+    parser.add_argument('-m', '--method', choices=sorted(METHODS),
+                        default='interpret',
+                        help='the interpret method to run')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='number of worker processes (default: one '
+                        'per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=100,
+                        help='records per task sent to a worker')
+    parser.add_argument('--unordered', action='store_true',
+                        help='write results as they are done, instead of '
+                        'in input order')
+    parser.add_argument('--start', type=int, default=0,
+                        help='skip this many records, to resume a run')
+    parser.add_argument('--index', action='store_true',
+                        help='skip to --start through an offset index '
+                        'kept next to each input file')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='cache results in this SQLite database, and '
+                        'reuse them for unchanged documents')
+    parser.add_argument('--progress', type=float, metavar='SECONDS',
+                        help='report progress on stderr every SECONDS')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not report the totals on stderr at the '
+                        'end')
+    parser.add_argument('--target', action='append', dest='target_urls',
+                        help='target url for --method comment, for '
+                        'records without "target_urls" (repeatable)')
+    for limit in ('max_depth', 'max_children', 'max_content_length',
+                  'max_items'):
+        parser.add_argument('--' + limit.replace('_', '-'), type=int,
+                            dest=limit, help='see mf2util.Limits')
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error('--chunk-size must be at least 1')
+
+    limits = None
+    limit_args = dict(
+        (name, getattr(args, name)) for name in (
+            'max_depth', 'max_children', 'max_content_length', 'max_items')
+        if getattr(args, name) is not None)
+    if limit_args:
+        limits = mf2util.Limits(**limit_args)
+
+    if args.output == '-':
+        out = sys.stdout
+    else:
+        out = io.open(args.output, 'w', encoding='utf-8')
+    try:
+        stats = run(args.files, out, method=args.method,
+                    workers=args.workers, chunk_size=args.chunk_size,
+                    ordered=not args.unordered, start=args.start,
+                    progress=args.progress, target_urls=args.target_urls,
+                    limits=limits, use_index=args.index,
+                    cache_path=args.cache)
+        if not args.quiet:
+            stats.report()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -50,7 +50,7 @@ License: `Simplified BSD <http://opensource.org/licenses/BSD-2-Clause>`__
       author='Kyle Mahan',
       author_email='kyle.mahan@gmail.com',
       url='http://indiewebcamp.com/mf2util',
-      py_modules=['mf2util'],
+      py_modules=['mf2util', 'mf2util_async', 'mf2util_cli'],
       tests_require=['pytest', 'mf2py'],
       cmdclass={'test': PyTest},
       classifiers=[
@@ -0,0 +1,127 @@
+"""Run the webmention pipeline end to end against stub fetch and parse
+functions."""
+import asyncio
+
+import mf2util_async
+
+
+def make_doc(source_url, reply_to):
+    return {
+        'items': [{
+            'type': ['h-entry'],
+            'properties': {
+                'url': [source_url],
+                'content': ['Great post!'],
+                'in-reply-to': [reply_to],
+            },
+        }],
+        'rels': {'author': ['http://example.com/author']},
+    }
+
+
+AUTHOR_PAGE = {
+    'items': [{
+        'type': ['h-card'],
+        'properties': {
+            'name': ['Author'],
+            'url': ['http://example.com/author'],
+            'uid': ['http://example.com/author'],
+        },
+    }],
+}
+
+
+def test_pipeline():
+    sources = dict(
+        ('http://example.com/reply/%d' % ii,
+         make_doc('http://example.com/reply/%d' % ii,
+                  'http://mydomain.com/post/%d' % (ii % 3)))
+        for ii in range(30))
+    fetch_attempts = {}
+    author_fetches = []
+    emitted = {}
+    errors = []
+
+    async def fetch(url):
+        fetch_attempts[url] = fetch_attempts.get(url, 0) + 1
+        await asyncio.sleep(0)
+        if url.endswith('/flaky') and fetch_attempts[url] == 1:
+            raise IOError('connection reset')
+        if url.endswith('/missing'):
+            raise IOError('404')
+        return url
+
+    def parse(html, source_url):
+        return sources[html]
+
+    def fetch_author(url):
+        author_fetches.append(url)
+        return AUTHOR_PAGE
+
+    async def emit(source_url, target_urls, result):
+        emitted[source_url] = result
+
+    sources['http://example.com/flaky'] = make_doc(
+        'http://example.com/flaky', 'http://mydomain.com/post/0')
+    mentions = [(url, ['http://mydomain.com/post/0']) for url in sources]
+    mentions.append(('http://example.com/missing', ['http://mydomain.com/']))
+
+    pipeline = mf2util_async.WebmentionPipeline(
+        fetch, parse, emit, fetch_mf2_func=fetch_author,
+        concurrency={'fetch': 4, 'interpret': 3}, retry_delay=0,
+        queue_size=2, on_error=lambda *args: errors.append(args))
+    asyncio.run(pipeline.run(mentions))
+
+    assert len(emitted) == 31
+    assert emitted['http://example.com/reply/3']['comment_type'] == ['reply']
+    assert emitted['http://example.com/reply/4']['comment_type'] == []
+    assert emitted['http://example.com/flaky']['comment_type'] == ['reply']
+    assert emitted['http://example.com/reply/3']['author'] == {
+        'name': 'Author', 'url': 'http://example.com/author'}
+    # the author page is only fetched once
+    assert author_fetches == ['http://example.com/author']
+
+    assert fetch_attempts['http://example.com/flaky'] == 2
+    assert fetch_attempts['http://example.com/missing'] == 3
+    assert [(url, stage) for url, stage, _ in errors] == [
+        ('http://example.com/missing', 'fetch')]
+
+    stats = pipeline.stats()
+    assert stats['processed'] == 31
+    assert stats['failed']['fetch'] == 1
+    assert stats['latency']['fetch']['count'] == 35
+    assert stats['latency']['interpret']['count'] == 31
+    assert stats['latency']['emit']['count'] == 31
+
+
+def test_failed_author_fetch():
+    sources = dict(
+        ('http://example.com/reply/%d' % ii,
+         make_doc('http://example.com/reply/%d' % ii,
+                  'http://mydomain.com/post'))
+        for ii in range(5))
+    author_fetches = []
+    emitted = {}
+
+    async def fetch(url):
+        return url
+
+    def parse(html, source_url):
+        return sources[html]
+
+    def fetch_author(url):
+        author_fetches.append(url)
+        return None
+
+    async def emit(source_url, target_urls, result):
+        emitted[source_url] = result
+
+    pipeline = mf2util_async.WebmentionPipeline(
+        fetch, parse, emit, fetch_mf2_func=fetch_author)
+    asyncio.run(pipeline.run(
+        [(url, ['http://mydomain.com/post']) for url in sources]))
+
+    assert len(emitted) == 5
+    assert 'author' not in emitted['http://example.com/reply/0']
+    # the failed fetch is remembered rather than repeated for each mention
+    assert author_fetches == ['http://example.com/author']
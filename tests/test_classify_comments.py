@@ -1,4 +1,5 @@
 import copy
+import json
 import mf2util
 
 TEST_BLOB = {
@@ -168,3 +169,205 @@ def test_h_cite():
 
     assert mf2util.classify_comment(blob, ('http://mydomain.com/my-post',))\
         == ['reply']
+
+
+def test_explicit_hentry():
+    """classify an h-entry other than the first one on the page"""
+    blob = copy.deepcopy(TEST_BLOB)
+    second = copy.deepcopy(blob['items'][1])
+    second['properties']['like-of'] = ['http://mydomain.com/my-post']
+    blob['items'].append(second)
+
+    targets = {'http://mydomain.com/my-post'}
+    assert mf2util.classify_comment(blob, targets) == []
+    assert mf2util.classify_comment(blob, targets, hentry=second) == ['like']
+
+
+def test_target_matcher():
+    blob = copy.deepcopy(TEST_BLOB)
+    blob['items'][1]['properties'].update({
+        'in-reply-to': ['https://MyDomain.com:443/my-post/#comments'],
+        'like-of': [{
+            'type': ['h-cite'],
+            'properties': {'url': ['http://mydoma.in/short']},
+        }],
+        'repost-of': ['http://mydomain.com/my-post?page=2'],
+    })
+
+    # exact matches only
+    assert mf2util.classify_comment(
+        blob, ['http://mydomain.com/my-post']) == []
+
+    matcher = mf2util.TargetMatcher(['http://mydomain.com/my-post'])
+    assert mf2util.classify_comment(blob, matcher) == ['reply']
+    matcher.add('https://mydoma.in/short/')
+    assert mf2util.classify_comment(blob, matcher) == ['reply', 'like']
+    assert len(matcher) == 2
+    assert 'mailto:me@mydomain.com' not in matcher
+    assert None not in matcher
+
+
+def test_classify_mentions():
+    index = mf2util.TargetIndex()
+    for ii in range(1000):
+        index.add('http://mydomain.com/post/%d' % ii,
+                  ['http://mydoma.in/%d' % ii])
+
+    blob = copy.deepcopy(TEST_BLOB)
+    blob['items'][1]['properties'].update({
+        'in-reply-to': [
+            'https://mydomain.com/post/12/',
+            'http://someoneelse.com/post',
+        ],
+        'like-of': [{
+            'type': ['h-cite'],
+            'properties': {'url': ['http://mydoma.in/12']},
+        }],
+        'repost-of': ['http://mydoma.in/345'],
+        'rsvp': ['yes'],
+    })
+
+    assert mf2util.classify_mentions(blob, index) == {
+        'http://mydomain.com/post/12': ['rsvp', 'reply', 'like'],
+        'http://mydomain.com/post/345': ['repost'],
+    }
+    assert mf2util.classify_mentions(TEST_BLOB, index) == {}
+
+
+def test_complex_url_values():
+    blob = copy.deepcopy(TEST_BLOB)
+    blob['items'][1]['properties'].update({
+        'in-reply-to': [{
+            'type': ['h-cite'],
+            'properties': {'url': [{'value': 'http://mydomain.com/my-post'}]},
+        }],
+    })
+    assert mf2util.classify_comment(
+        blob, {'http://mydomain.com/my-post'}) == []
+
+
+def test_find_target_links():
+    html = ('<p>Replying to <a class="u-in-reply-to" '
+            'href="https://mydomain.com/my-post/">this</a>, '
+            'see also <a href="/other">my other post</a> and '
+            '<img src="http://mydoma.in/short"/>'
+            '<a href="http://mydomain.com/my-post">again</a></p>')
+    targets = ['http://mydomain.com/my-post', 'http://someoneelse.com/other']
+    assert mf2util.find_target_links(html, targets) == {
+        'http://mydomain.com/my-post': [html.index('https://mydomain'),
+                                        html.index('http://mydomain')],
+    }
+
+    # relative links are resolved against the source
+    assert mf2util.find_target_links(
+        html, targets, source_url='http://someoneelse.com/notes/1') == {
+        'http://mydomain.com/my-post': [html.index('https://mydomain'),
+                                        html.index('http://mydomain')],
+        'http://someoneelse.com/other': [html.index('/other')],
+    }
+
+    index = mf2util.TargetIndex()
+    index.add('http://mydomain.com/my-post', ['http://mydoma.in/short'])
+    assert mf2util.find_target_links(html, index) == {
+        'http://mydomain.com/my-post': [html.index('https://mydomain'),
+                                        html.index('http://mydoma.in'),
+                                        html.index('http://mydomain')],
+    }
+    assert mf2util.find_target_links('no links here', index) == {}
+
+
+def test_malformed_urls():
+    # urlparse raises ValueError on these; they just never match
+    bad = 'http://[oops/'
+    blob = copy.deepcopy(TEST_BLOB)
+    blob['items'][1]['properties'].update({
+        'in-reply-to': [bad],
+        'like-of': ['http://mydomain.com/my-post'],
+    })
+    matcher = mf2util.TargetMatcher(['http://mydomain.com/my-post', bad])
+    assert mf2util.classify_comment(blob, matcher) == ['reply', 'like']
+    assert mf2util.classify_comment(
+        blob, ['http://mydomain.com/my-post']) == ['like']
+
+    index = mf2util.TargetIndex()
+    index.add('http://mydomain.com/my-post')
+    assert mf2util.classify_mentions(blob, index) == {
+        'http://mydomain.com/my-post': ['like']}
+
+    html = '<a href="%s">bad</a><a href="/my-post">good</a>' % bad
+    assert mf2util.find_target_links(
+        html, index, source_url='http://mydomain.com/') == {
+        'http://mydomain.com/my-post': [html.index('/my-post')]}
+    assert mf2util.convert_relative_paths_to_absolute(
+        'http://mydomain.com/', None, html) == (
+        '<a href="%s">bad</a><a href="http://mydomain.com/my-post">good</a>'
+        % bad)
+
+
+def test_response_aggregator():
+    target = 'http://mydomain.com/my-event'
+
+    def mention(author, published, updated=None, deleted=None, **props):
+        blob = copy.deepcopy(TEST_BLOB)
+        entry = blob['items'][1]['properties']
+        entry.update(props)
+        entry['author'] = [author]
+        entry['published'] = [published]
+        if updated:
+            entry['updated'] = [updated]
+        if deleted:
+            entry['deleted'] = [deleted]
+        return mf2util.interpret_comment(
+            blob, 'http://example.com/reply/1', [target])
+
+    agg = mf2util.ResponseAggregator()
+    agg.add(target, 'http://a.com/1', mention(
+        'http://a.com/', '2014-05-07T10:00:00+00:00',
+        **{'in-reply-to': [target], 'rsvp': ['Yes']}))
+    agg.add(target, 'http://b.com/1', mention(
+        'http://b.com/', '2014-05-07T10:00:00+00:00',
+        **{'in-reply-to': [target], 'rsvp': ['maybe']}))
+    agg.add(target, 'http://b.com/2', mention(
+        'http://b.com/', '2014-05-07T11:00:00+00:00', **{'like-of': [target]}))
+    agg.add(target, 'http://c.com/1', mention(
+        'http://c.com/', '2014-05-07T10:00:00+00:00',
+        **{'in-reply-to': [target]}))
+    assert agg.counts(target) == {'reply': 1, 'like': 1}
+    assert agg.rsvp_counts(target) == {'yes': 1, 'maybe': 1}
+
+    # a new RSVP from the same author replaces the older one, even from
+    # another source; given in a different timezone
+    agg.add(target, 'http://b.com/3', mention(
+        'https://b.com', '2014-05-07T06:00:00-06:00',
+        **{'in-reply-to': [target], 'rsvp': ['yes']}))
+    assert agg.rsvp_counts(target) == {'yes': 2}
+    assert agg.rsvps(target) == {'//a.com': 'yes', '//b.com': 'yes'}
+
+    # updating a post replaces its previous mention, older copies are ignored
+    updated = mention('http://c.com/', '2014-05-07T10:00:00+00:00',
+                      '2014-05-08', **{'repost-of': [target]})
+    assert agg.add(target, 'http://c.com/1', updated)
+    assert not agg.add(target, 'http://c.com/1', mention(
+        'http://c.com/', '2014-05-07T10:00:00+00:00',
+        **{'in-reply-to': [target]}))
+    assert agg.counts(target) == {'repost': 1, 'like': 1}
+
+    # deleting the newer RSVP brings back the older one
+    agg.add(target, 'http://b.com/3', mention(
+        'http://b.com/', '2014-05-07T12:00:00+00:00',
+        deleted='2014-05-09', **{'in-reply-to': [target], 'rsvp': ['yes']}))
+    assert agg.rsvp_counts(target) == {'yes': 1, 'maybe': 1}
+    assert not agg.add(target, 'http://b.com/3', mention(
+        'http://b.com/', '2014-05-07T12:00:00+00:00',
+        **{'in-reply-to': [target], 'rsvp': ['yes']}))
+    agg.remove(target, 'http://b.com/2')
+    agg.add(target, 'http://a.com/1', None)
+    assert agg.counts(target) == {'repost': 1}
+    assert agg.rsvp_counts(target) == {'maybe': 1}
+
+    saved = json.loads(json.dumps(agg.to_dict()))
+    loaded = mf2util.ResponseAggregator.from_dict(saved)
+    assert loaded.counts(target) == {'repost': 1}
+    assert loaded.rsvps(target) == {'//b.com': 'maybe'}
+    assert loaded.to_dict() == saved
+    assert loaded.counts('http://mydomain.com/other') == {}
@@ -0,0 +1,142 @@
+"""Run the bulk JSON Lines interpreter (python -m mf2util) on a small
+input."""
+import io
+import json
+import os
+import subprocess
+import sys
+
+import mf2util
+import mf2util_cli
+
+
+def make_record(ii):
+    return {
+        'source_url': 'http://example.com/%d' % ii,
+        'parsed': {
+            'items': [{
+                'type': ['h-entry'],
+                'properties': {
+                    'name': ['Post %d' % ii],
+                    'content': ['Some words about post %d' % ii],
+                    'published': ['2015-03-%02dT12:00:00Z' % (ii % 28 + 1)],
+                    'in-reply-to': [{
+                        'type': ['h-cite'],
+                        'properties': {'url': ['http://mydomain.com/post']},
+                    }],
+                },
+            }],
+        },
+    }
+
+
+def write_input(tmpdir, count):
+    path = str(tmpdir.join('input.jsonl'))
+    with io.open(path, 'w', encoding='utf-8') as f:
+        for ii in range(count):
+            f.write(json.dumps(make_record(ii)) + '\n')
+            if ii == 3:
+                f.write('not json\n')
+            f.write('\n')
+    return path
+
+
+def run(path, **kwargs):
+    out, err = io.StringIO(), io.StringIO()
+    stats = mf2util_cli.run([path], out, err=err, **kwargs)
+    return [json.loads(line) for line in out.getvalue().splitlines()], stats
+
+
+def test_run(tmpdir):
+    path = write_input(tmpdir, 20)
+    results, stats = run(path, workers=1, chunk_size=3)
+    assert [r['index'] for r in results] == list(range(21))
+    assert stats.records == 21
+    assert stats.errors == 1
+    assert stats.resume == 21
+    assert 'error' in results[4]
+    assert results[5]['result']['name'] == 'Post 4'
+    assert results[5]['result']['published'] == '2015-03-05T12:00:00Z'
+
+    # resume part way through
+    resumed, stats = run(path, workers=1, chunk_size=3, start=15)
+    assert resumed == results[15:]
+    assert stats.records == 6
+
+    # the same results from a process pool, in order or not
+    pooled, _ = run(path, workers=2, chunk_size=3)
+    assert pooled == results
+    unordered, stats = run(path, workers=2, chunk_size=3, ordered=False)
+    assert sorted(unordered, key=lambda r: r['index']) == results
+    assert stats.resume == 21
+
+    comments, _ = run(path, workers=1, method='comment',
+                      target_urls=['http://mydomain.com/post'])
+    assert comments[0]['result']['comment_type'] == ['reply']
+
+    # a second run with the same cache is answered from it
+    cache_path = str(tmpdir.join('cache.db'))
+    assert run(path, workers=2, cache_path=cache_path)[0] == results
+    mf2util.metrics.reset()
+    assert run(path, workers=1, cache_path=cache_path)[0] == results
+    assert mf2util.metrics.reset()['result_cache_hits'] == 20
+
+
+def test_main(tmpdir):
+    path = write_input(tmpdir, 5)
+    output = str(tmpdir.join('output.jsonl'))
+    root = os.path.join(os.path.dirname(__file__), '..')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'mf2util', '--workers', '2',
+         '--max-depth', '0', '-o', output, path],
+        cwd=root, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    assert proc.returncode == 0
+    assert b'6 records (1 errors)' in err
+    with io.open(output, encoding='utf-8') as f:
+        results = [json.loads(line) for line in f]
+    assert [r['index'] for r in results] == list(range(6))
+    assert results[0]['result']['truncated'] is True
+
+
+def test_json_lines_file(tmpdir, monkeypatch):
+    path = write_input(tmpdir, 20)
+    with mf2util_cli.JsonLinesFile(path) as corpus:
+        assert len(corpus) == 21
+        assert corpus[0] == make_record(0)
+        assert corpus[-1] == make_record(19)
+        assert corpus.line(4) == b'not json'
+        assert corpus[5:8] == [make_record(ii) for ii in range(4, 7)]
+        assert list(corpus.iter_records(19)) == [
+            make_record(18), make_record(19)]
+
+        shards = corpus.shards(3)
+        assert len(shards) == 3
+        assert shards[0].start == 0 and shards[-1].stop == 21
+        assert all(a.stop == b.start for a, b in zip(shards, shards[1:]))
+    records = [r for shard in shards[1:]
+               for r in mf2util_cli.iter_shard(shard)]
+    assert records == [make_record(ii) for ii in range(
+        shards[1].start - 1, 20)]
+
+    # the saved index is used the next time, until the file changes
+    assert os.path.exists(path + '.idx')
+
+    def no_scan(*args):
+        raise AssertionError('index rebuilt')
+    monkeypatch.setattr(mf2util_cli, '_line_offsets', no_scan)
+    with mf2util_cli.JsonLinesFile(path) as corpus:
+        assert corpus[20] == make_record(19)
+    monkeypatch.undo()
+
+    with io.open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(make_record(20)) + '\n')
+    with mf2util_cli.JsonLinesFile(path) as corpus:
+        assert len(corpus) == 22
+
+    # resume from the index
+    out = io.StringIO()
+    mf2util_cli.run([path, path], out, workers=1, start=40, use_index=True,
+                    err=io.StringIO())
+    assert [json.loads(line)['index'] for line in
+            out.getvalue().splitlines()] == [40, 41, 42, 43]
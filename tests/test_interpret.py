@@ -6,6 +6,7 @@ from __future__ import unicode_literals
 from datetime import datetime, date, timedelta
 import mf2util
 import json
+import pytest
 
 
 def load_test(testname):
@@ -163,6 +164,15 @@ def test_convert_relative_paths():
     assert result['content'] == 'This is an <img alt="alt text" title="the title" src="http://example.com/static/img.jpg"/> example document with <a href="http://example.com/relative_paths.html">relative paths</a>.'
 
 
+def test_convert_relative_paths_lt_in_attribute():
+    # a < inside a quoted attribute value does not end the tag
+    html = mf2util.convert_relative_paths_to_absolute(
+        'http://example.com/blog/post', None,
+        '<source alt="a<b" src=\'../z\'><img title="1 < 2" src="a.jpg">')
+    assert html == ('<source alt="a<b" src=\'http://example.com/z\'>'
+                    '<img title="1 < 2" src="http://example.com/blog/a.jpg">')
+
+
 def test_no_p_name():
     parsed = load_test('article_no_p-name')
     result = mf2util.interpret(
@@ -315,3 +325,834 @@ def test_location_top_level():
         'latitude': '37.83',
         'longitude': '-122.25',
     }
+
+
+def test_h_feed_parallel():
+    """Interpreting a feed in a process pool should give exactly the same
+    entries, in the same order, as the serial version.
+    """
+    parsed = {
+        'items': [{
+            'type': ['h-feed'],
+            'properties': {
+                'name': ['Archive'],
+                'author': [{
+                    'type': ['h-card'],
+                    'properties': {
+                        'name': ['Feed Author'],
+                        'url': ['http://example.com/'],
+                    },
+                }],
+            },
+            'children': [{
+                'type': ['h-entry'],
+                'properties': {
+                    'name': ['Post %d' % ii],
+                    'url': ['/posts/%d' % ii],
+                    'published': ['2015-03-%02dT12:00:00-07:00' % (ii % 28 + 1)],
+                    'content': [{
+                        'html': '<a href="/tags/%d">tag</a> post %d' % (ii, ii),
+                        'value': 'tag post %d' % ii,
+                    }],
+                },
+            } for ii in range(25)],
+        }],
+        'rels': {},
+    }
+    serial = mf2util.interpret_feed(parsed, 'http://example.com/')
+    parallel = mf2util.interpret_feed(
+        parsed, 'http://example.com/', max_workers=3)
+    assert parallel == serial
+    assert len(parallel['entries']) == 25
+    assert parallel['entries'][7]['author'] == {
+        'name': 'Feed Author',
+        'url': 'http://example.com/',
+    }
+    assert parallel['entries'][7]['content'] == \
+        '<a href="http://example.com/tags/7">tag</a> post 7'
+
+
+def test_h_feed_parallel_limits():
+    """max_items applies to the whole feed, not to each worker's share"""
+    parsed = {
+        'items': [{
+            'type': ['h-entry'],
+            'properties': {
+                'name': ['Post %d' % ii],
+                'url': ['http://example.com/posts/%d' % ii],
+                'in-reply-to': [{
+                    'type': ['h-cite'],
+                    'properties': {'url': ['http://a.com/%d' % ii]},
+                }],
+            },
+        } for ii in range(100)],
+        'rels': {},
+    }
+    limits = mf2util.Limits(max_items=10)
+    serial = mf2util.interpret_feed(parsed, 'http://example.com/',
+                                    limits=limits)
+    parallel = mf2util.interpret_feed(
+        parsed, 'http://example.com/', max_workers=2, limits=limits)
+    assert parallel == serial
+    assert len(parallel['entries']) == 5
+    assert parallel['truncated'] is True
+
+
+def test_h_feed_incremental():
+    def make_entry(num, content):
+        return {
+            'type': ['h-entry'],
+            'properties': {
+                'url': ['http://example.com/posts/%d' % num],
+                'content': [{'html': content, 'value': content}],
+            },
+        }
+
+    parsed = {
+        'items': [{
+            'type': ['h-feed'],
+            'properties': {'name': ['Posts']},
+            'children': [make_entry(1, 'one'), make_entry(2, 'two')],
+        }],
+    }
+    result = mf2util.interpret_feed_incremental(parsed, 'http://example.com/')
+    assert result['name'] == 'Posts'
+    assert [e['content'] for e in result['entries']] == ['one', 'two']
+    assert result['removed'] == []
+
+    # state is plain json, so it can be stored between crawls
+    state = json.loads(json.dumps(result['state']))
+    result = mf2util.interpret_feed_incremental(
+        parsed, 'http://example.com/', state)
+    assert result['entries'] == []
+    assert result['removed'] == []
+
+    parsed['items'][0]['children'] = [
+        make_entry(3, 'three'), make_entry(2, 'two, edited')]
+    result = mf2util.interpret_feed_incremental(
+        parsed, 'http://example.com/', result['state'])
+    assert [e['content'] for e in result['entries']] == [
+        'three', 'two, edited']
+    assert result['removed'] == ['http://example.com/posts/1']
+
+    # a change to the feed itself invalidates every entry
+    parsed['items'][0]['properties']['name'] = ['Renamed']
+    result = mf2util.interpret_feed_incremental(
+        parsed, 'http://example.com/', result['state'])
+    assert len(result['entries']) == 2
+    assert result['removed'] == []
+
+
+def test_nested_memoization():
+    def make_cite():
+        return {
+            'type': ['h-cite'],
+            'properties': {
+                'url': ['http://example.com/original'],
+                'content': [{'html': '<img src="/a.jpg"/>', 'value': ''}],
+            },
+        }
+
+    shared = make_cite()
+    parsed = {
+        'items': [{
+            'type': ['h-feed'],
+            'properties': {},
+            'children': [
+                {'type': ['h-entry'], 'properties': {'in-reply-to': [shared]}},
+                {'type': ['h-entry'], 'properties': {'in-reply-to': [shared]}},
+                {'type': ['h-entry'], 'properties': {'like-of': [make_cite()]}},
+            ],
+        }],
+    }
+    entries = mf2util.interpret_feed(parsed, 'http://example.com/')['entries']
+    assert entries[0]['in-reply-to'][0] is entries[1]['in-reply-to'][0]
+    assert entries[0]['in-reply-to'][0] is not entries[2]['like-of'][0]
+    assert entries[0]['in-reply-to'][0] == entries[2]['like-of'][0]
+    assert entries[0]['in-reply-to'][0]['content'] == \
+        '<img src="http://example.com/a.jpg"/>'
+
+    entries = mf2util.interpret_feed(
+        parsed, 'http://example.com/', memoize_by_url=True)['entries']
+    assert entries[0]['in-reply-to'][0] is entries[2]['like-of'][0]
+
+
+def test_cite_cache():
+    def make_mention(content):
+        return {
+            'items': [{
+                'type': ['h-entry'],
+                'properties': {
+                    'content': ['Nice post!'],
+                    'in-reply-to': [{
+                        'type': ['h-cite'],
+                        'properties': {
+                            'url': ['http://example.com/popular'],
+                            'content': [content],
+                        },
+                    }],
+                },
+            }],
+        }
+
+    cache = mf2util.CiteCache(maxsize=10)
+    first = mf2util.interpret(make_mention('original'),
+                              'http://a.example/', cite_cache=cache)
+    second = mf2util.interpret(make_mention('original'),
+                               'http://b.example/', cite_cache=cache)
+    assert first['in-reply-to'][0]['content'] == 'original'
+    assert first['in-reply-to'][0] is second['in-reply-to'][0]
+    assert len(cache) == 1
+
+    # an edited copy of the same post is interpreted again
+    third = mf2util.interpret(make_mention('edited'),
+                              'http://c.example/', cite_cache=cache)
+    assert third['in-reply-to'][0]['content'] == 'edited'
+    assert len(cache) == 2
+
+    # relative paths are resolved against each mentioning document
+    first = mf2util.interpret(make_mention('<img src="a.jpg"/>'),
+                              'http://a.example/', cite_cache=cache)
+    second = mf2util.interpret(make_mention('<img src="a.jpg"/>'),
+                               'http://b.example/', cite_cache=cache)
+    assert first['in-reply-to'][0]['content'] == \
+        '<img src="http://a.example/a.jpg"/>'
+    assert second['in-reply-to'][0]['content'] == \
+        '<img src="http://b.example/a.jpg"/>'
+
+    cache = mf2util.CiteCache(maxsize=1)
+    mf2util.interpret(make_mention('original'), 'http://a.example/',
+                      cite_cache=cache)
+    mf2util.interpret(make_mention('edited'), 'http://a.example/',
+                      cite_cache=cache)
+    assert len(cache) == 1
+
+    # authors are fetched for the items that were cached without fetching
+    mention = make_mention('original')
+    cite = mention['items'][0]['properties']['in-reply-to'][0]
+    cite['properties']['author'] = ['http://author.example/']
+    result = mf2util.interpret(mention, 'http://a.example/',
+                               cite_cache=cache)
+    assert result['in-reply-to'][0]['author'] == {
+        'url': 'http://author.example/'}
+    result = mf2util.interpret(
+        mention, 'http://a.example/', cite_cache=cache,
+        fetch_mf2_func=lambda url: {'items': [{
+            'type': ['h-card'],
+            'properties': {'name': ['Author'], 'url': [url]},
+        }]})
+    assert result['in-reply-to'][0]['author']['name'] == 'Author'
+
+
+def test_cite_cache_deep_document(monkeypatch):
+    calls = []
+    fingerprint = mf2util._fingerprint
+    monkeypatch.setattr(mf2util, '_fingerprint',
+                        lambda obj: calls.append(1) or fingerprint(obj))
+
+    # each dict and list is hashed once, however deep the document, and
+    # keys are computed without recursion
+    parsed = reply_chain(3000)
+    result = mf2util.interpret(parsed, 'http://a.com/',
+                               cite_cache=mf2util.CiteCache(),
+                               limits=mf2util.Limits(max_depth=3))
+    assert result['truncated'] is True
+    assert len(calls) < 8 * 3000
+
+
+def test_limits():
+    # a reply chain nested 50 levels deep
+    item = {'type': ['h-cite'], 'properties': {'url': ['http://example.com/0']}}
+    for ii in range(1, 50):
+        item = {
+            'type': ['h-cite'] if ii < 49 else ['h-entry'],
+            'properties': {
+                'url': ['http://example.com/%d' % ii],
+                'in-reply-to': [item],
+                'comment': [item] * 100,
+                'content': [{'html': '<a href="/">x</a>' * 10, 'value': 'x'}],
+            },
+        }
+    parsed = {'items': [item]}
+
+    result = mf2util.interpret(parsed, 'http://example.com/')
+    assert 'truncated' not in result
+
+    result = mf2util.interpret(
+        parsed, 'http://example.com/', limits=mf2util.Limits(max_depth=3))
+    assert result['truncated']
+    depth = 0
+    while 'in-reply-to' in result and 'type' in result['in-reply-to'][0]:
+        result = result['in-reply-to'][0]
+        depth += 1
+    assert depth == 3
+    # past the limit, nested items are reduced to their url
+    assert result['in-reply-to'] == [{'url': 'http://example.com/45'}]
+    assert result['truncated']
+
+    result = mf2util.interpret(
+        parsed, 'http://example.com/', limits=mf2util.Limits(max_children=2))
+    assert result['truncated']
+    assert len(result['comment']) == 2
+
+    result = mf2util.interpret(
+        parsed, 'http://example.com/',
+        limits=mf2util.Limits(max_content_length=20))
+    assert result['truncated']
+    assert result['content'] == '<a href="/">x</a>' * 10
+
+    result = mf2util.interpret(
+        parsed, 'http://example.com/', limits=mf2util.Limits(max_items=5))
+    assert result['truncated']
+    assert len(result['comment']) == 100
+    assert sum('type' in c for c in result['comment']) <= 5
+
+
+def test_limits_feed():
+    parsed = {'items': [{
+        'type': ['h-entry'],
+        'properties': {'name': ['Post %d' % ii]},
+    } for ii in range(10)]}
+    result = mf2util.interpret_feed(parsed, 'http://example.com/')
+    assert len(result['entries']) == 10
+    assert 'truncated' not in result
+
+    result = mf2util.interpret_feed(
+        parsed, 'http://example.com/', limits=mf2util.Limits(max_children=4))
+    assert len(result['entries']) == 4
+    assert result['truncated']
+
+    result = mf2util.interpret_feed(
+        parsed, 'http://example.com/', limits=mf2util.Limits(max_items=6))
+    assert len(result['entries']) == 6
+    assert result['truncated']
+
+
+def test_thread_index():
+    index = mf2util.ThreadIndex()
+
+    # a post with a comment and a like, and its reply context
+    post = mf2util.interpret(
+        load_test('note_with_comment_and_like'),
+        'https://kylewm.com/2015/10/big-thing-missing-from-my-indieweb-experience-is')
+    post_key = index.add(post)
+    assert post_key
+    assert index.get(post['url']) is post
+    comment_url = post['comment'][0]['url']
+    like_url = post['like'][0]['url']
+    assert [e['url'] for e in index.descendants(post['url'])] == [
+        comment_url, like_url]
+    assert index.descendants(post['url'], types=('like',)) == [post['like'][0]]
+    assert index.ancestors(comment_url) == [post]
+
+    # a reply to the comment arrives later, by its http url
+    reply = {'url': 'https://example.com/reply', 'uid': 'tag:example.com,1',
+             'in-reply-to': [{'url': comment_url.replace('https:', 'http:')}]}
+    index.add(reply)
+    assert index.ancestors('https://example.com/reply/') == [
+        post['comment'][0], post]
+    assert index.descendants(post['url'], types=('reply',)) == [
+        post['comment'][0], reply]
+
+    # a repost that refers to the reply by its uid
+    repost = {'url': 'https://example.org/repost',
+              'repost-of': ['tag:example.com,1']}
+    index.add(repost)
+    assert index.ancestors(repost['url'], types=('repost',)) == [reply]
+    assert index.ancestors(repost['url'], types=('reply',)) == []
+
+    # updating the reply drops the edges of the previous version
+    reply2 = {'url': 'https://example.com/reply', 'in-reply-to': [post['url']]}
+    index.add(reply2)
+    assert index.get('tag:example.com,1') is reply2
+    assert index.ancestors(reply['url']) == [post]
+    assert index.descendants(comment_url) == []
+
+    # cycles and entries without an identity
+    index.add({'url': 'http://a.com/1', 'in-reply-to': ['http://a.com/2']})
+    index.add({'url': 'http://a.com/2', 'in-reply-to': ['http://a.com/1']})
+    assert [e['url'] for e in index.descendants('http://a.com/1')] == [
+        'http://a.com/2']
+    assert index.add({'name': 'nothing'}) is None
+    assert 'http://a.com/1' in index
+    assert 'http://a.com/3' not in index
+
+
+def test_thread_index_records():
+    # nested reply contexts and comments are records too
+    post = mf2util.interpret(
+        load_test('note_with_comment_and_like'),
+        'https://kylewm.com/2015/10/big-thing-missing-from-my-indieweb-experience-is',
+        want_records=True)
+    reply = mf2util.interpret(reply_chain(3), 'http://a.com/',
+                              want_records=True)
+    index = mf2util.ThreadIndex()
+    index.add(post)
+    index.add(reply)
+
+    comment_url = post['comment'][0]['url']
+    assert [e['url'] for e in index.descendants(post['url'])] == [
+        comment_url, post['like'][0]['url']]
+    assert index.ancestors(comment_url) == [post]
+    assert [e['url'] for e in index.ancestors('http://a.com/2')] == [
+        'http://a.com/1', 'http://a.com/0']
+
+
+def test_deep_reply_chain_records():
+    # converting to records and back does not recurse per level either
+    parsed = reply_chain(400)
+    result = mf2util.interpret(parsed, 'http://a.com/')
+    records = mf2util.interpret(parsed, 'http://a.com/', want_records=True)
+    assert records.to_dict() == result
+    index = mf2util.ThreadIndex()
+    index.add(records)
+    assert len(index.ancestors('http://a.com/398')) == 398
+
+
+def test_merge_timelines():
+    read = []
+
+    def feed(name, days, want_json=False):
+        for day in days:
+            read.append((name, day))
+            published = datetime(2015, 1, day, 12, 0)
+            yield {
+                'url': 'http://%s.com/%d' % (name, day),
+                'published': (published.isoformat() + '+00:00' if want_json
+                              else published.replace(tzinfo=mf2util.utc)),
+            }
+
+    feeds = [feed('a', [9, 5, 1]), feed('b', [8, 7, 2], want_json=True),
+             feed('c', [6, 3])]
+    timeline = mf2util.merge_timelines(feeds, limit=4)
+    assert [e['url'] for e in timeline] == [
+        'http://a.com/9', 'http://b.com/8', 'http://b.com/7', 'http://c.com/6']
+    # only read as far as needed
+    assert read == [('a', 9), ('b', 8), ('c', 6), ('a', 5), ('b', 7), ('b', 2)]
+
+    # duplicates across feeds, entries without a date, oldest first
+    shared = {'uid': 'tag:shared', 'url': 'http://a.com/s',
+              'published': '2015-01-04'}
+    feeds = [
+        [{'url': 'http://a.com/1', 'published': '2015-01-01T00:00:00-08:00'},
+         shared],
+        [{'url': 'http://b.com/1', 'published': '2015-01-01T07:00:00Z'},
+         dict(shared, url='http://b.com/s'),
+         {'url': 'https://a.com/1'}],
+        [],
+    ]
+    assert [e['url'] for e in mf2util.merge_timelines(
+        feeds, newest_first=False)] == [
+        'http://b.com/1', 'http://a.com/1', 'http://a.com/s']
+    assert [e['url'] for e in mf2util.merge_timelines(feeds[1:])] == [
+        'http://b.com/1', 'http://b.com/s', 'https://a.com/1']
+
+
+def test_records():
+    import pickle
+
+    for name in ('note_with_comment_and_like', 'hwc-event', 'location_h-card'):
+        parsed = load_test(name)
+        expected = mf2util.interpret(parsed, 'http://example.com/')
+        record = mf2util.interpret(parsed, 'http://example.com/',
+                                   want_records=True)
+        assert record.to_dict() == expected
+        assert pickle.loads(pickle.dumps(record)).to_dict() == expected
+        assert not hasattr(record, '__dict__')
+
+    record = mf2util.interpret(
+        load_test('note_with_comment_and_like'), 'http://example.com/',
+        want_records=True)
+    assert isinstance(record, mf2util.EntryRecord)
+    assert record['type'] == record.type == 'entry'
+    assert record.content_plain == record['content-plain']
+    assert record.get('summary') is None and 'summary' not in record
+    assert isinstance(record['comment'], tuple)
+    assert isinstance(record['comment'][0]['author'], mf2util.AuthorRecord)
+    assert dict(record['author']) == {
+        'name': 'Kyle Mahan',
+        'photo': 'https://kylewm.com/static/img/users/kyle.jpg',
+        'url': 'https://kylewm.com',
+    }
+    try:
+        record.name = 'changed'
+        assert False, 'records are immutable'
+    except AttributeError:
+        pass
+
+    event = mf2util.interpret_event(
+        load_test('hwc-event'), 'http://example.com/', want_records=True)
+    assert isinstance(event, mf2util.EventRecord)
+    assert isinstance(event['location'], mf2util.LocationRecord)
+
+    # equal authors are shared between the entries of a feed
+    feed = mf2util.interpret_feed({'items': [{
+        'type': ['h-feed'],
+        'properties': {'author': ['http://example.com/']},
+        'children': [{
+            'type': ['h-entry'],
+            'properties': {'name': ['Entry %d' % ii],
+                           'in-reply-to': ['http://other.com/%d' % ii]},
+        } for ii in range(3)],
+    }]}, 'http://example.com/', want_records=True)
+    first, second, third = feed['entries']
+    assert first['author'] is second['author'] is third['author']
+    assert isinstance(first['in-reply-to'][0], mf2util.ReferenceRecord)
+    assert first['in-reply-to'][0] == {'url': 'http://other.com/0'}
+
+
+def test_dump_feed():
+    import io
+
+    parsed = {
+        'items': [{
+            'type': ['h-feed'],
+            'properties': {
+                'name': ['A feed \u2603'],
+                'author': ['http://example.com/'],
+            },
+            'children': [{
+                'type': ['h-entry'],
+                'properties': {
+                    'name': ['Post %d' % ii],
+                    'url': ['/posts/%d' % ii],
+                    'published': ['2015-03-%02dT12:00:00-07:00' % (ii + 1)],
+                    'content': [{
+                        'html': '<a href="/tags/%d">tag</a> post %d' % (ii, ii),
+                        'value': 'tag post %d' % ii,
+                    }],
+                },
+            } for ii in range(20)],
+        }],
+        'rels': {},
+    }
+    for kwargs in ({}, {'limits': mf2util.Limits(max_children=5)}):
+        expected = mf2util.interpret_feed(
+            parsed, 'http://example.com/', want_json=True, **kwargs)
+
+        out = io.StringIO()
+        assert mf2util.dump_feed(
+            parsed, 'http://example.com/', out, **kwargs) == len(
+                expected['entries'])
+        assert out.getvalue() == json.dumps(expected)
+
+        out = io.BytesIO()
+        mf2util.dump_feed(parsed, 'http://example.com/', out, lines=True,
+                          **kwargs)
+        lines = out.getvalue().decode('utf-8').splitlines()
+        assert [json.loads(line) for line in lines] == expected['entries']
+
+    # top-level entries without an h-feed
+    parsed = {'items': parsed['items'][0]['children'][:3], 'rels': {}}
+    out = io.StringIO()
+    mf2util.dump_feed(parsed, 'http://example.com/', out)
+    assert out.getvalue() == json.dumps(mf2util.interpret_feed(
+        parsed, 'http://example.com/', want_json=True))
+
+
+def test_dump_feed_bounded_memo(monkeypatch):
+    import io
+
+    sizes = []
+    set_item = mf2util._LRUCache.set
+
+    def set_and_measure(self, key, value):
+        set_item(self, key, value)
+        sizes.append(len(self))
+    monkeypatch.setattr(mf2util._LRUCache, 'set', set_and_measure)
+    monkeypatch.setattr(mf2util, 'DUMP_FEED_NESTED_ITEMS', 4)
+
+    # every entry replies to its own post, and to one they all share
+    shared = {'type': ['h-cite'], 'properties': {'url': ['http://a.com/s']}}
+    parsed = {'items': [{
+        'type': ['h-entry'],
+        'properties': {
+            'url': ['http://example.com/%d' % ii],
+            'in-reply-to': [
+                {'type': ['h-cite'],
+                 'properties': {'url': ['http://a.com/%d' % ii]}},
+                shared,
+            ],
+        },
+    } for ii in range(50)], 'rels': {}}
+    out = io.StringIO()
+    mf2util.dump_feed(parsed, 'http://example.com/', out, lines=True)
+    assert len(sizes) == 51
+    assert max(sizes) == 4
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == \
+        mf2util.interpret_feed(parsed, 'http://example.com/',
+                               want_json=True)['entries']
+
+
+def test_compact_document():
+    import glob
+    import io
+    import pickle
+
+    for path in sorted(glob.glob('tests/interpret/*.json')):
+        parsed = json.load(open(path))
+        compact = mf2util.compact_document(parsed)
+        assert compact.to_dict() == parsed
+        assert pickle.loads(pickle.dumps(compact)).to_dict() == parsed
+
+        for want_json in (False, True):
+            assert mf2util.interpret(
+                compact, 'http://example.com/', want_json=want_json) \
+                == mf2util.interpret(
+                    parsed, 'http://example.com/', want_json=want_json)
+        assert mf2util.interpret_feed(compact, 'http://example.com/') \
+            == mf2util.interpret_feed(parsed, 'http://example.com/')
+        assert mf2util.interpret_feed_incremental(
+            compact, 'http://example.com/')['state'] \
+            == mf2util.interpret_feed_incremental(
+                parsed, 'http://example.com/')['state']
+
+    # nested values are plain dicts and lists in the result
+    parsed = {'items': [{
+        'type': ['h-entry'],
+        'properties': {
+            'url': ['http://example.com/1'],
+            'author': [{
+                'type': ['h-card'],
+                'properties': {
+                    'name': ['Author'],
+                    'photo': [{'value': 'http://example.com/me.jpg',
+                               'alt': 'Me'}],
+                },
+            }],
+            'location': [{
+                'type': ['h-card'],
+                'properties': {
+                    'name': [{'value': 'Cafe', 'html': '<b>Cafe</b>'}],
+                    'locality': ['Portland'],
+                },
+            }],
+        },
+    }], 'rels': {}}
+    compact = mf2util.compact_document(parsed)
+    result = mf2util.interpret(compact, 'http://example.com/',
+                               want_json=True)
+    assert json.loads(json.dumps(result)) == mf2util.interpret(
+        parsed, 'http://example.com/', want_json=True)
+    assert result['author']['photo'] == {
+        'value': 'http://example.com/me.jpg', 'alt': 'Me'}
+    assert type(result['location']['name']) is dict
+    out = io.StringIO()
+    mf2util.dump_feed(compact, 'http://example.com/', out)
+    assert json.loads(out.getvalue())['entries'] == [result]
+
+    compact = mf2util.compact_document(load_test('note_with_comment_and_like'))
+    entry = mf2util.find_first_entry(compact, ['h-entry'])
+    assert isinstance(entry, mf2util.CompactNode)
+    assert isinstance(entry['properties']['comment'], tuple)
+    assert entry.get('missing') is None and 'missing' not in entry
+    # the keys are shared between nodes, and type strings are interned
+    other = mf2util.compact_document(load_test('note_with_comment_and_like'))
+    other_entry = mf2util.find_first_entry(other, ['h-entry'])
+    assert entry._keys is other_entry._keys
+    assert entry['type'][0] is other_entry['type'][0]
+    try:
+        entry._keys = ()
+        assert False, 'compact nodes are immutable'
+    except AttributeError:
+        pass
+
+
+def test_tracer():
+    class Recorder(object):
+        def __init__(self):
+            self.events = []
+
+        def start(self, stage, item_type, depth):
+            self.events.append(('start', stage, item_type, depth))
+
+        def end(self, stage, item_type, depth):
+            self.events.append(('end', stage, item_type, depth))
+
+    parsed = load_test('reply_h-cite')
+    recorder = Recorder()
+    result = mf2util.interpret_comment(
+        parsed, 'http://example.com/', ['http://example.com/target'],
+        fetch_mf2_func=lambda url: {'items': [], 'rels': {}},
+        tracer=recorder)
+    assert result == mf2util.interpret_comment(
+        parsed, 'http://example.com/', ['http://example.com/target'],
+        fetch_mf2_func=lambda url: {'items': [], 'rels': {}})
+
+    # events are properly nested
+    stack = []
+    for event, stage, item_type, depth in recorder.events:
+        if event == 'start':
+            stack.append((stage, item_type, depth))
+        else:
+            assert stack.pop() == (stage, item_type, depth)
+    assert not stack
+
+    starts = [event[1:] for event in recorder.events if event[0] == 'start']
+    assert starts[0] == ('find', None, 0)
+    assert ('interpret', 'h-entry', 0) in starts
+    assert ('interpret', 'h-cite', 1) in starts
+    assert ('datetime', 'h-entry', 0) in starts
+    assert ('content', 'h-entry', 0) in starts
+    assert ('classify', 'h-entry', 0) in starts
+
+    ticks = []
+
+    def clock():
+        ticks.append(len(ticks))
+        return ticks[-1]
+
+    timer = mf2util.StageTimer(clock=clock)
+    for _ in range(2):
+        mf2util.interpret(parsed, 'http://example.com/', tracer=timer)
+    stats = timer.stats()
+    assert stats['find']['count'] == 2
+    interpret = stats['interpret']
+    assert interpret['count'] == 4
+    assert interpret['total'] > interpret['self'] > 0
+    assert stats['datetime']['self'] == stats['datetime']['total']
+    # the clock ticks once per event, and the self times add up to the
+    # time spent in the top-level stages, 'find' and 'interpret': all the
+    # ticks but the first of each of them
+    assert sum(s['self'] for s in stats.values()) == len(ticks) - 2 * 2
+    timer.reset()
+    assert timer.stats() == {}
+
+
+def test_metrics():
+    mf2util.metrics.reset()
+
+    def fetch(url):
+        raise IOError('unreachable')
+
+    parsed = {
+        'items': [{
+            'type': ['h-entry'],
+            'properties': {
+                'author': ['http://example.com/about'],
+                'published': ['yesterday'],
+                'in-reply-to': [{
+                    'type': ['h-cite'],
+                    'properties': {'url': ['http://a.example.com/1'],
+                                   'updated': ['March 3rd, 2015']},
+                }],
+            },
+        }],
+    }
+    with pytest.raises(IOError):
+        mf2util.interpret_entry(parsed, 'http://example.com/1',
+                                fetch_mf2_func=fetch)
+    mf2util.interpret_entry(parsed, 'http://example.com/1')
+
+    snapshot = mf2util.metrics.reset()
+    assert snapshot['documents'] == 1
+    assert snapshot['items'] == 2
+    assert snapshot['max_depth'] == 1
+    assert snapshot['fetches'] == 1
+    assert snapshot['fetch_failures'] == 1
+    # the failed document had parsed its published date before the fetch
+    assert snapshot['datetime_failures'] == 3
+    assert snapshot['datetime_failure_patterns'] == {
+        'a': 2, 'a 9a, 9': 1}
+    assert mf2util.metrics.snapshot()['documents'] == 0
+
+
+def test_metrics_log_rate_limit(caplog):
+    now = [0.0]
+    metrics = mf2util.Metrics(log_limit=2, log_interval=60,
+                              clock=lambda: now[0])
+    for _ in range(5):
+        metrics.datetime_failure('2015-13')
+    now[0] = 61
+    metrics.datetime_failure('2015-14')
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert messages == [
+        'Failed to parse datetime 2015-13',
+        'Failed to parse datetime 2015-13',
+        'Failed to parse datetime 2015-14 (and 3 more since the last '
+        'message)',
+    ]
+    assert metrics.snapshot()['datetime_failure_patterns'] == {'9-9': 6}
+
+
+def test_result_cache(tmpdir):
+    parsed = load_test('article_naive_datetime')
+    url = 'http://example.com/post'
+
+    for cache in (mf2util.ResultCache(),
+                  mf2util.SQLiteResultCache(str(tmpdir.join('cache.db')))):
+        mf2util.metrics.reset()
+        first = mf2util.interpret(parsed, url, result_cache=cache)
+        assert first == mf2util.interpret(parsed, url)
+        # a copy of the document is the same document
+        again = mf2util.interpret(json.loads(json.dumps(parsed)), url,
+                                  result_cache=cache)
+        assert again == first
+        # any parameter that changes the result is part of the key
+        as_json = mf2util.interpret(parsed, url, want_json=True,
+                                    result_cache=cache)
+        assert as_json == mf2util.interpret(parsed, url, want_json=True)
+        records = mf2util.interpret(parsed, url, want_records=True,
+                                    result_cache=cache)
+        assert records.to_dict() == first
+
+        feed = mf2util.interpret_feed(parsed, url, result_cache=cache)
+        assert mf2util.interpret_feed(parsed, url, result_cache=cache) == feed
+        comment = mf2util.interpret_comment(
+            parsed, url, ['http://example.com/target'], result_cache=cache)
+        assert comment['comment_type'] == []
+        assert mf2util.interpret_comment(
+            parsed, url, mf2util.TargetMatcher(['http://example.com/target']),
+            result_cache=cache) == comment
+
+        # results that depend on fetched pages are not cached
+        mf2util.interpret(parsed, url, result_cache=cache,
+                          fetch_mf2_func=lambda url: {'items': []})
+
+        snapshot = mf2util.metrics.reset()
+        assert snapshot['result_cache_misses'] == 5
+        assert snapshot['result_cache_hits'] == 3
+        assert len(cache) == 5
+
+        # memoize_by_url is part of the key too
+        mf2util.interpret(parsed, url, memoize_by_url=True,
+                          result_cache=cache)
+        assert len(cache) == 6
+
+        # every hit is a copy the caller may change
+        hit = mf2util.interpret_comment(
+            parsed, url, ['http://example.com/target'], result_cache=cache)
+        hit['comment_type'].append('reply')
+        assert mf2util.interpret_comment(
+            parsed, url, ['http://example.com/target'],
+            result_cache=cache)['comment_type'] == []
+
+        # documents too deep to key are interpreted but not cached
+        result = mf2util.interpret(reply_chain(3000), url, result_cache=cache,
+                                   limits=mf2util.Limits(max_depth=3))
+        assert result['truncated'] is True
+        assert len(cache) == 6
+
+
+def reply_chain(length):
+    item = {'type': ['h-cite'], 'properties': {'url': ['http://a.com/0']}}
+    for ii in range(1, length):
+        item = {'type': ['h-cite'],
+                'properties': {'url': ['http://a.com/%d' % ii],
+                               'in-reply-to': [item]}}
+    item['type'] = ['h-entry']
+    return {'items': [item], 'rels': {}}
+
+
+def test_deep_reply_chain():
+    # two stack frames per level of nesting, as before the tracer and the
+    # per-document context were added, so this fits in the default
+    # recursion limit
+    parsed = reply_chain(400)
+    result = mf2util.interpret(parsed, 'http://a.com/')
+    depth = 0
+    while 'in-reply-to' in result:
+        result = result['in-reply-to'][0]
+        depth += 1
+    assert depth == 399
@@ -0,0 +1,82 @@
+"""Run the functions that see raw, possibly hostile, input on large
+pathological inputs, and check they still give the right answer. That
+they take time linear in the size of the input is checked by timing them
+at two sizes with `python benchmarks/run.py --scaling`, which is kept out
+of the test suite because timings are unreliable on a loaded machine.
+"""
+import mf2util
+import pytest
+
+N = 40000
+
+
+def convert(html):
+    return mf2util.convert_relative_paths_to_absolute(
+        'http://example.com/', None, html)
+
+
+def parse_datetime(s):
+    try:
+        return mf2util.parse_datetime(s)
+    except ValueError:
+        return None
+
+
+def cite_authors(count):
+    """Interpret an h-feed with an author, whose entries each reply to a
+    cite without one, and count the entries and cites given an author"""
+    parsed = {'items': [{
+        'type': ['h-feed'],
+        'properties': {'author': ['http://example.com/']},
+        'children': [{
+            'type': ['h-entry'],
+            'properties': {
+                'url': ['http://example.com/%d' % i],
+                'in-reply-to': [{
+                    'type': ['h-cite'],
+                    'properties': {'url': ['http://example.org/%d' % i]},
+                }],
+            },
+        } for i in range(count)],
+    }], 'rels': {}}
+    entries = mf2util.interpret_feed(parsed, 'http://example.com/')['entries']
+    return (sum('author' in entry for entry in entries),
+            sum('author' in entry['in-reply-to'][0] for entry in entries))
+
+
+# name: (function, input, expected output)
+CASES = {
+    'unclosed tags': (convert, '<a ' * N, '<a ' * N),
+    'unclosed url tags': (convert, '<img ' * N, '<img ' * N),
+    'unclosed brackets': (convert, '<' * N, '<' * N),
+    'long tag body': (convert, '<a' + ' ' * N, '<a' + ' ' * N),
+    'repeated attributes': (convert, '<a ' + 'href = ' * N + '>',
+                            '<a ' + 'href = ' * N + '>'),
+    'unclosed quote': (convert, '<a href="x' + ' href="' * N,
+                       '<a href="http://example.com/x' + ' href="' * N),
+    'no closing quote': (convert, '<a href="' + '<img ' * N,
+                         '<a href="' + '<img ' * N),
+    'lt in quotes': (convert, '<img alt="' + '<' * N + '" src="a">',
+                     '<img alt="' + '<' * N +
+                     '" src="http://example.com/a">'),
+    'many urls': (convert, '<video src="a" poster="b">' * (N // 10),
+                  '<video src="http://example.com/a" '
+                  'poster="http://example.com/b">' * (N // 10)),
+    'link scan': (lambda html: len(mf2util.find_target_links(
+        html, ['http://example.com/%d' % i for i in range(1000)])
+        ['http://example.com/1']),
+        '<a href="http://example.com/1">' * (N // 10), N // 10),
+    'long year': (parse_datetime, '1' * N, None),
+    'long fraction': (parse_datetime,
+                      '2014-01-01T10:10:10.' + '1' * N + 'x', None),
+    'long whitespace': (parse_datetime, '2014-01-01' + ' \t' * N + 'x', None),
+    'name and content': (lambda n: mf2util.is_name_a_title(*n),
+                         ('a' * N, 'a' * (N // 2) + 'b'), True),
+    'author-less cites': (cite_authors, N // 10, (N // 10, 0)),
+}
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_pathological_input(case):
+    func, arg, expected = CASES[case]
+    assert func(arg) == expected